@@ -17,12 +17,29 @@ class BaseAgent:
         """Initialize the agent with a name and Claude client."""
         self.name = name
         self.claude = ClaudeClient()
+        self.token = None
         self.log("Initialized")
 
+    def set_token(self, token):
+        """Bind a job's CancelToken to this agent and the API clients it uses."""
+        self.token = token
+        self.claude.token = token
+        if hasattr(self, "replicate"):
+            self.replicate.token = token
+
     def log(self, message):
         """Print a message prefixed with the agent's name."""
         print(f"[{self.name}] {message}")
 
+    def log_usage(self):
+        """Log token usage of the last Claude call, including prompt cache hits."""
+        usage = self.claude.last_usage
+        self.log(
+            f"Tokens - input: {usage['input_tokens']}, output: {usage['output_tokens']}, "
+            f"cache write: {usage['cache_creation_input_tokens']}, "
+            f"cache read: {usage['cache_read_input_tokens']}"
+        )
+
     def run(self, input_data):
         """Execute the agent's main task. Must be overridden by subclasses."""
         raise NotImplementedError(
@@ -1,40 +1,31 @@
 """Director agent that plans video structure and shot composition."""
 
 from agents.base import BaseAgent
+from models.claude_client import cached_text
+from models.schemas import ShotPlan, LongFormPlan
 
-
-class DirectorAgent(BaseAgent):
-    """Plans video structure by breaking prompts into shots with camera angles and timing."""
-
-    def __init__(self):
-        super().__init__("Director")
-
-    def run(self, user_prompt):
-        """Create a shot plan from the user's prompt."""
-        self.log(f"Planning video for: {user_prompt}")
-
-        director_prompt = f'''You are a film director planning a short video.
-
-USER'S REQUEST: "{user_prompt}"
+# Static instructions, sent as a cached system prompt so only the user's
+# request changes between calls
+DIRECTOR_INSTRUCTIONS = '''You are a film director planning a short video.
 
 Create a shot plan for a 4-8 second video. Break it into 3-5 shots.
 
 Return ONLY valid JSON in this exact format:
-{{
+{
     "title": "Short descriptive title",
     "total_duration": <number of seconds>,
     "style": "visual style description (e.g., cinematic, anime, realistic)",
     "shots": [
-        {{
+        {
             "shot_number": 1,
             "type": "<wide/medium/close-up/extreme-close-up>",
             "duration": <seconds>,
             "description": "What happens in this shot",
             "camera_movement": "<static/pan/zoom/tracking>",
             "elements": ["list", "of", "key", "visual", "elements"]
-        }}
+        }
     ]
-}}
+}
 
 Guidelines:
 - Start with an establishing shot (wide) to set the scene
@@ -45,8 +36,109 @@ Guidelines:
 
 Return ONLY the JSON, no other text.'''
 
-        shot_plan = self.claude.send_structured(director_prompt)
+LONG_FORM_INSTRUCTIONS = '''You are a film director planning a longer video.
+
+First divide the story into acts (beginning, development, climax, resolution or
+similar), then break each act into shots. Aim for roughly one shot every 2-4
+seconds of the requested duration.
+
+Return ONLY valid JSON in this exact format:
+{
+    "title": "Short descriptive title",
+    "total_duration": <number of seconds>,
+    "style": "visual style description (e.g., cinematic, anime, realistic)",
+    "style_digest": "2-3 sentences fixing the look of the whole video: palette, lighting, lens, recurring characters and their appearance",
+    "acts": [
+        {
+            "act_number": 1,
+            "title": "Short act title",
+            "summary": "What happens in this act",
+            "shots": [
+                {
+                    "shot_number": 1,
+                    "type": "<wide/medium/close-up/extreme-close-up>",
+                    "duration": <seconds>,
+                    "description": "What happens in this shot",
+                    "camera_movement": "<static/pan/zoom/tracking>",
+                    "elements": ["list", "of", "key", "visual", "elements"]
+                }
+            ]
+        }
+    ]
+}
+
+Guidelines:
+- Open each act with a shot that re-establishes the setting
+- Use variety in shot types within every act
+- Number shots consecutively across the whole video, not per act
+- Total duration of all shots should equal total_duration
+- Keep descriptions vivid but concise
+
+Return ONLY the JSON, no other text.'''
+
+
+class DirectorAgent(BaseAgent):
+    """Plans video structure by breaking prompts into shots with camera angles and timing."""
+
+    def __init__(self):
+        super().__init__("Director")
+
+    def run(self, user_prompt, long_form=False, target_duration=60):
+        """Create a shot plan from the user's prompt.
+
+        In long-form mode the plan is built as acts of shots, aiming for
+        target_duration seconds; the flattened shot list is also returned
+        under 'shots' so later stages work unchanged.
+        """
+        if long_form:
+            return self._run_long_form(user_prompt, target_duration)
+
+        self.log(f"Planning video for: {user_prompt}")
+
+        director_prompt = f'''USER'S REQUEST: "{user_prompt}"
+
+Create the shot plan for this request.'''
+
+        shot_plan = self.claude.send_structured(
+            director_prompt,
+            system=[cached_text(DIRECTOR_INSTRUCTIONS)],
+            schema=ShotPlan
+        )
+        self.log_usage()
 
         self.log(f"Created {len(shot_plan['shots'])} shots, {shot_plan['total_duration']}s total")
 
         return shot_plan
+
+    def _run_long_form(self, user_prompt, target_duration):
+        """Plan a long video as acts, then shots."""
+        self.log(f"Planning {target_duration}s long-form video for: {user_prompt}")
+
+        director_prompt = f'''USER'S REQUEST: "{user_prompt}"
+
+TARGET DURATION: about {target_duration} seconds
+
+Create the act and shot plan for this request.'''
+
+        shot_plan = self.claude.send_structured(
+            director_prompt,
+            max_tokens=16000,
+            system=[cached_text(LONG_FORM_INSTRUCTIONS)],
+            schema=LongFormPlan
+        )
+        self.log_usage()
+
+        # Renumber shots globally so keyframe ids stay unique across acts
+        shots = []
+        for act in shot_plan['acts']:
+            for shot in act['shots']:
+                shot['shot_number'] = len(shots) + 1
+                shots.append(shot)
+        shot_plan['shots'] = shots
+
+        self.log(
+            f"Created {len(shot_plan['acts'])} acts, {len(shots)} shots, "
+            f"{shot_plan['total_duration']}s total"
+        )
+
+        return shot_plan
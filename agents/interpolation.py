@@ -2,7 +2,6 @@
 
 import os
 import sys
-import time
 
 # Add project root to path
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -11,7 +10,13 @@ if PROJECT_ROOT not in sys.path:
 
 from agents.base import BaseAgent
 from models.replicate_client import ReplicateClient
-from PIL import Image
+from utils.keyframe_analysis import (
+    analyze_keyframes, default_plan, HOLD, CROSSFADE, INTERPOLATE, DEFAULT_TIMES_TO_INTERPOLATE
+)
+from utils.cancellation import check, sleep
+from utils.frame_manifest import (
+    FrameManifest, MANIFEST_NAME, image_entry, video_entry, crossfade_entry, count_video_frames
+)
 
 
 class InterpolationAgent(BaseAgent):
@@ -21,93 +26,140 @@ class InterpolationAgent(BaseAgent):
         super().__init__("Interpolation")
         self.replicate = ReplicateClient()
 
-    def run(self, keyframe_paths, output_folder):
-        """Generate smooth frames between keyframes using FILM model."""
+    def run(self, keyframe_paths, output_folder, on_segment=None):
+        """Generate smooth frames between keyframes using FILM model.
+
+        Returns a FrameManifest (saved as manifest.json in output_folder) that
+        references keyframes in place and FILM's clips directly, rather than
+        copying every frame out as a PNG. If given, on_segment is called with
+        each pair's frames as soon as they are ready, e.g. to stream them out.
+        """
         self.log(f"Interpolating {len(keyframe_paths)} keyframes")
 
         os.makedirs(output_folder, exist_ok=True)
-        all_frames = []
-        frame_counter = 0
+        manifest = FrameManifest(os.path.join(output_folder, MANIFEST_NAME), fps=24)
+
+        plans = self._analyze(keyframe_paths)
 
         for i in range(len(keyframe_paths) - 1):
             frame1_path = keyframe_paths[i]
             frame2_path = keyframe_paths[i + 1]
+            plan = plans[i]
 
-            self.log(f"[{i+1}/{len(keyframe_paths)-1}] {os.path.basename(frame1_path)} -> {os.path.basename(frame2_path)}")
-
-            time.sleep(12)
-
-            try:
-                if i == 0:
-                    frame_counter += 1
-                    dest_path = os.path.join(output_folder, f"frame_{frame_counter:04d}.png")
-                    self._copy_image(frame1_path, dest_path)
-                    all_frames.append(dest_path)
-
-                video_url = self.replicate.interpolate_frames(frame1_path, frame2_path)
-
-                extracted = self._extract_frames_from_video(
-                    video_url,
-                    output_folder,
-                    frame_counter + 1
-                )
-
-                for path in extracted:
-                    frame_counter += 1
-                    all_frames.append(path)
+            self.log(f"[{i+1}/{len(keyframe_paths)-1}] {os.path.basename(frame1_path)} -> {os.path.basename(frame2_path)} ({self._describe(plan)})")
 
-                frame_counter += 1
-                dest_path = os.path.join(output_folder, f"frame_{frame_counter:04d}.png")
-                self._copy_image(frame2_path, dest_path)
-                all_frames.append(dest_path)
+            check(self.token)
 
-            except Exception as e:
-                self.log(f"ERROR: {e}")
-                if i == 0:
-                    frame_counter += 1
-                    dest_path = os.path.join(output_folder, f"frame_{frame_counter:04d}.png")
-                    self._copy_image(frame1_path, dest_path)
-                    all_frames.append(dest_path)
+            # Holds, crossfades and clips kept from an interrupted run need no FILM call
+            if plan['mode'] == INTERPOLATE and not self._segment_exists(output_folder, frame1_path, frame2_path):
+                sleep(self.token, 12)
 
-                frame_counter += 1
-                dest_path = os.path.join(output_folder, f"frame_{frame_counter:04d}.png")
-                self._copy_image(frame2_path, dest_path)
-                all_frames.append(dest_path)
+            manifest.add_segment(self._interpolate_pair(
+                frame1_path,
+                frame2_path,
+                output_folder,
+                include_first=(i == 0),
+                plan=plan
+            ))
+            manifest.save()
 
-        self.log(f"Done - {len(all_frames)} total frames")
-        return all_frames
+            if on_segment:
+                on_segment(manifest.iter_segment_frames(i))
 
-    def _copy_image(self, src_path, dest_path):
-        """Copy an image file to a new location."""
-        img = Image.open(src_path)
-        img.save(dest_path)
+        manifest.save()
+        self.log(f"Done - {manifest.frame_count} total frames")
+        return manifest
 
-    def _extract_frames_from_video(self, video_url, output_folder, start_num):
-        """Download video and extract frames."""
-        import cv2
-
-        temp_video = os.path.join(output_folder, "temp_interpolated.mp4")
-        self.replicate.download_image(video_url, temp_video)
-
-        cap = cv2.VideoCapture(temp_video)
-        frames = []
-        frame_num = start_num
-
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-
-            dest_path = os.path.join(output_folder, f"frame_{frame_num:04d}.png")
-            cv2.imwrite(dest_path, frame)
-            frames.append(dest_path)
-            frame_num += 1
-
-        cap.release()
+    def run_segment(self, frame1_path, frame2_path, output_folder, include_first=False):
+        """Interpolate a single keyframe pair into its own segment folder and manifest."""
+        self.log(f"Segment {os.path.basename(frame1_path)} -> {os.path.basename(frame2_path)}")
 
+        os.makedirs(output_folder, exist_ok=True)
+        plan = self._analyze([frame1_path, frame2_path])[0]
+        self.log(self._describe(plan))
+
+        manifest = FrameManifest(os.path.join(output_folder, MANIFEST_NAME), fps=24)
+        manifest.add_segment(self._interpolate_pair(
+            frame1_path, frame2_path, output_folder, include_first=include_first, plan=plan
+        ))
+        manifest.save()
+        return manifest
+
+    def _analyze(self, keyframe_paths):
+        """Plan each pair's transition, falling back to full FILM calls if analysis fails."""
         try:
-            os.remove(temp_video)
-        except:
-            pass
+            return analyze_keyframes(keyframe_paths)
+        except Exception as e:
+            self.log(f"WARNING: keyframe analysis failed ({e}), interpolating every pair")
+            return [default_plan() for _ in range(len(keyframe_paths) - 1)]
+
+    def _describe(self, plan):
+        """Summarize a pair plan for the log."""
+        if plan['motion'] is None:
+            return plan['mode']
+        return f"{plan['mode']}, motion {plan['motion']:.3f}, hash distance {plan['hash_distance']}"
+
+    def _interpolate_pair(self, frame1_path, frame2_path, output_folder,
+                          include_first, plan=None):
+        """Describe the frames for one keyframe pair, falling back to a hard cut on error."""
+        plan = plan or default_plan()
+        # Every pair gets the same number of frames before frame2, whatever its mode,
+        # so saving FILM work on low-motion pairs never changes the video's pacing
+        pair_frames = 2 ** DEFAULT_TIMES_TO_INTERPOLATE
+        repeat = 2 ** (DEFAULT_TIMES_TO_INTERPOLATE - plan['times_to_interpolate'])
+        entries = []
+
+        if include_first:
+            entries.append(image_entry(frame1_path))
 
-        return frames
+        try:
+            if plan['mode'] == HOLD:
+                entries.append(image_entry(frame1_path, hold=pair_frames))
+            elif plan['mode'] == CROSSFADE:
+                entries.append(crossfade_entry(frame1_path, frame2_path, pair_frames))
+            else:
+                video_path = self._segment_path(output_folder, frame1_path, frame2_path)
+                if os.path.exists(video_path):
+                    entries.append(self._clip_entry(video_path, repeat))
+                else:
+                    video_url = self.replicate.interpolate_frames(
+                        frame1_path, frame2_path, times_to_interpolate=plan['times_to_interpolate']
+                    )
+                    entries.append(self._download_segment(video_url, video_path, repeat))
+
+        except Exception as e:
+            self.log(f"ERROR: {e}")
+
+        entries.append(image_entry(frame2_path))
+        return entries
+
+    def _segment_path(self, output_folder, frame1_path, frame2_path):
+        """Where FILM's clip for a keyframe pair is kept.
+
+        The clip is named after both keyframes, not the pair's position, so a
+        resumed run whose keyframe list changed never reuses the wrong clip.
+        """
+        name1 = os.path.splitext(os.path.basename(frame1_path))[0]
+        name2 = os.path.splitext(os.path.basename(frame2_path))[0]
+        return os.path.join(output_folder, f"segment_{name1}__{name2}.mp4")
+
+    def _segment_exists(self, output_folder, frame1_path, frame2_path):
+        """True if a clip for this pair survives from an interrupted run."""
+        return os.path.exists(self._segment_path(output_folder, frame1_path, frame2_path))
+
+    def _download_segment(self, video_url, video_path, repeat=1):
+        """Download FILM's clip and reference its frames instead of extracting them."""
+        self.replicate.download_image(video_url, video_path)
+        return self._clip_entry(video_path, repeat)
+
+    def _clip_entry(self, video_path, repeat=1):
+        """Reference a FILM clip, stretched by `repeat` to a full pair's length.
+
+        The clip's last frame is frame2 itself, which follows as its own entry,
+        so it is left out: 2**times frames shown `repeat` times each.
+        """
+        count = count_video_frames(video_path)
+        if count == 0:
+            raise ValueError(f"No frames in interpolated video {video_path}")
+
+        return video_entry(video_path, max(1, count - 1), repeat=repeat)
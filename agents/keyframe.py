@@ -2,7 +2,6 @@
 
 import os
 import sys
-import time
 
 # Add project root to path
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -11,6 +10,7 @@ if PROJECT_ROOT not in sys.path:
 
 from agents.base import BaseAgent
 from models.replicate_client import ReplicateClient
+from utils.cancellation import check, sleep
 
 
 class KeyframeAgent(BaseAgent):
@@ -29,26 +29,38 @@ class KeyframeAgent(BaseAgent):
 
         for i, keyframe in enumerate(scene_data['keyframes']):
             keyframe_id = keyframe['keyframe_id']
-            prompt = keyframe['prompt']
 
             self.log(f"[{i+1}/{len(scene_data['keyframes'])}] {keyframe_id}")
+            check(self.token)
 
-            try:
-                image_url = self.replicate.generate_image(
-                    prompt=prompt,
-                    aspect_ratio="16:9"
-                )
-
-                save_path = os.path.join(output_folder, f"{keyframe_id}.png")
-                self.replicate.download_image(image_url, save_path)
+            # Keyframes from an interrupted run are reused when it is resumed
+            existing_path = os.path.join(output_folder, f"{keyframe_id}.png")
+            if os.path.exists(existing_path):
+                self.log("Already generated, skipping")
+                generated_images.append(existing_path)
+                continue
 
+            try:
+                save_path = self.generate_keyframe(keyframe, output_folder)
                 generated_images.append(save_path)
 
                 if i < len(scene_data['keyframes']) - 1:
-                    time.sleep(12)
+                    sleep(self.token, 12)
 
             except Exception as e:
                 self.log(f"ERROR: {e}")
 
         self.log(f"Done - {len(generated_images)} images generated")
         return generated_images
+
+    def generate_keyframe(self, keyframe, output_folder):
+        """Generate and save a single keyframe image, returning its path."""
+        image_url = self.replicate.generate_image(
+            prompt=keyframe['prompt'],
+            aspect_ratio="16:9"
+        )
+
+        save_path = os.path.join(output_folder, f"{keyframe['keyframe_id']}.png")
+        self.replicate.download_image(image_url, save_path)
+
+        return save_path
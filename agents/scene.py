@@ -1,34 +1,24 @@
 """Scene agent that creates detailed image prompts from shot plans."""
 
-from agents.base import BaseAgent
-
-
-class SceneAgent(BaseAgent):
-    """Creates detailed image generation prompts from shot plans."""
-
-    def __init__(self):
-        super().__init__("Scene")
-
-    def run(self, shot_plan):
-        """Create detailed image prompts from the shot plan."""
-        self.log(f"Creating prompts for {len(shot_plan['shots'])} shots")
+from concurrent.futures import ThreadPoolExecutor
 
-        scene_prompt = f'''You are an expert at writing prompts for AI image generation (Flux/Stable Diffusion).
-
-VIDEO TITLE: "{shot_plan['title']}"
-STYLE: {shot_plan['style']}
+from agents.base import BaseAgent
+from models.claude_client import cached_text
+from models.schemas import SceneData
 
-SHOT PLAN:
-{self._format_shots(shot_plan['shots'])}
+# Static instructions, sent as a cached system prompt so only the title,
+# style and shot list change between calls
+SCENE_INSTRUCTIONS = '''You are an expert at writing prompts for AI image generation (Flux/Stable Diffusion).
 
+You will be given a video title, a visual style and a shot plan.
 For each shot, create 1-2 keyframe prompts. Each keyframe should be a detailed image prompt.
 
 Return ONLY valid JSON in this exact format:
-{{
-    "title": "{shot_plan['title']}",
-    "style": "{shot_plan['style']}",
+{
+    "title": "<the video title, unchanged>",
+    "style": "<the visual style, unchanged>",
     "keyframes": [
-        {{
+        {
             "keyframe_id": "shot1_key1",
             "shot_number": 1,
             "timestamp": 0.0,
@@ -36,9 +26,9 @@ Return ONLY valid JSON in this exact format:
             "negative_prompt": "Things to avoid: blurry, low quality, distorted, etc.",
             "elements": ["key", "visual", "elements"],
             "notes": "Any special considerations"
-        }}
+        }
     ]
-}}
+}
 
 PROMPT WRITING GUIDELINES:
 1. Be specific and detailed (50-100 words per prompt)
@@ -51,11 +41,96 @@ PROMPT WRITING GUIDELINES:
 
 Return ONLY the JSON, no other text.'''
 
-        scene_data = self.claude.send_structured(scene_prompt)
+
+class SceneAgent(BaseAgent):
+    """Creates detailed image generation prompts from shot plans."""
+
+    def __init__(self, max_concurrency=4):
+        super().__init__("Scene")
+        self.max_concurrency = max_concurrency
+
+    def run(self, shot_plan):
+        """Create detailed image prompts from the shot plan."""
+        if shot_plan.get('acts'):
+            return self._run_acts(shot_plan)
+
+        self.log(f"Creating prompts for {len(shot_plan['shots'])} shots")
+
+        scene_prompt = f'''VIDEO TITLE: "{shot_plan['title']}"
+STYLE: {shot_plan['style']}
+
+SHOT PLAN:
+{self._format_shots(shot_plan['shots'])}'''
+
+        scene_data = self.claude.send_structured(
+            scene_prompt,
+            system=[cached_text(SCENE_INSTRUCTIONS)],
+            schema=SceneData
+        )
+        self.log_usage()
         self.log(f"Created {len(scene_data['keyframes'])} keyframe prompts")
 
         return scene_data
 
+    def _run_acts(self, shot_plan):
+        """Expand a long-form plan with one request per act, the later acts concurrently."""
+        acts = shot_plan['acts']
+        self.log(f"Creating prompts for {len(shot_plan['shots'])} shots across {len(acts)} acts")
+
+        # The first act runs alone so it writes the shared system-prompt cache;
+        # the rest then fan out and read it instead of each writing their own
+        results = [self._expand_act(shot_plan, acts[0])]
+        if len(acts) > 1:
+            with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(acts) - 1)) as pool:
+                results.extend(pool.map(lambda act: self._expand_act(shot_plan, act), acts[1:]))
+
+        keyframes = []
+        seen_ids = set()
+        for act_keyframes in results:
+            for keyframe in act_keyframes:
+                # Keyframe ids become filenames, so they must be unique across acts
+                if keyframe['keyframe_id'] in seen_ids:
+                    keyframe['keyframe_id'] = f"{keyframe['keyframe_id']}_{len(keyframes) + 1}"
+                seen_ids.add(keyframe['keyframe_id'])
+                keyframes.append(keyframe)
+
+        usage = self.claude.usage
+        self.log(
+            f"Created {len(keyframes)} keyframe prompts "
+            f"(cache read: {usage['cache_read_input_tokens']}, "
+            f"cache write: {usage['cache_creation_input_tokens']})"
+        )
+
+        return {
+            "title": shot_plan['title'],
+            "style": shot_plan['style'],
+            "keyframes": keyframes
+        }
+
+    def _expand_act(self, shot_plan, act):
+        """Create keyframe prompts for one act, sharing the video's style digest."""
+        act_prompt = f'''VIDEO TITLE: "{shot_plan['title']}"
+STYLE: {shot_plan['style']}
+STYLE DIGEST (keep every keyframe consistent with this): {shot_plan.get('style_digest', '')}
+
+ACT {act['act_number']}: {act.get('title', '')}
+{act.get('summary', '')}
+
+SHOT PLAN:
+{self._format_shots(act['shots'])}
+
+Use the shot numbers exactly as given.'''
+
+        scene_data = self.claude.send_structured(
+            act_prompt,
+            max_tokens=8192,
+            system=[cached_text(SCENE_INSTRUCTIONS)],
+            schema=SceneData
+        )
+        self.log(f"Act {act['act_number']}: {len(scene_data['keyframes'])} keyframe prompts")
+
+        return scene_data['keyframes']
+
     def _format_shots(self, shots):
         """Format shots into a readable string for the prompt."""
         formatted = []
@@ -8,6 +8,8 @@ if PROJECT_ROOT not in sys.path:
     sys.path.insert(0, PROJECT_ROOT)
 
 from orchestrator import Orchestrator
+from utils.cancellation import JobCancelled
+from models.backends import FASTEST, SLOS
 
 
 def print_banner():
@@ -50,20 +52,70 @@ def get_prompt_from_user():
             print()
 
 
+def submit_to_queue(args, long_form=False):
+    """Queue a job for distributed workers instead of rendering it here."""
+    from utils.task_queue import open_queue
+    from worker import submit_job
+
+    if not args:
+        print("Usage: python main.py --queue URL \"Your video description\"")
+        return 1
+
+    queue_url = args[0]
+    prompt = " ".join(args[1:]) or get_prompt_from_user()
+
+    project_id = submit_job(prompt, open_queue(queue_url), long_form=long_form)
+    print(f"Queued project {project_id}")
+    print(f"Start workers with: python worker.py --queue {queue_url}\n")
+    return 0
+
+
 def main():
     """Main entry point."""
     print_banner()
 
     args = sys.argv[1:]
+    stream = "--stream" in args
+    remux = "--remux" in args
+    long_form = "--long" in args
+
+    # --name=value options
+    options = {}
+    for arg in args:
+        if arg.startswith("--") and "=" in arg:
+            name, value = arg[2:].split("=", 1)
+            options[name] = value
+    args = [arg for arg in args if arg not in ("--stream", "--remux", "--long") and not
+            (arg.startswith("--") and "=" in arg)]
+
+    if args and args[0] == "--queue":
+        return submit_to_queue(args[1:], long_form=long_form)
+
+    slo = options.get("slo", FASTEST)
+    if slo not in SLOS:
+        print(f"Unknown SLO '{slo}'. Choose one of: {', '.join(SLOS)}")
+        return 1
+
+    resume_id = options.get("resume")
     if args:
         prompt = " ".join(args)
         print(f"Prompt: \"{prompt}\"\n")
+    elif resume_id:
+        prompt = ""
     else:
         prompt = get_prompt_from_user()
 
     try:
         orchestrator = Orchestrator()
-        video_path = orchestrator.run(prompt)
+        video_path = orchestrator.run(
+            prompt,
+            stream=stream or remux,
+            remux_stream=remux,
+            long_form=long_form,
+            slo=slo,
+            deadline=float(options["deadline"]) if "deadline" in options else None,
+            project_id=resume_id
+        )
 
         print("\n" + "=" * 60)
         print(f"SUCCESS! Video ready: {video_path}")
@@ -75,6 +127,10 @@ def main():
         print("\n\nCancelled by user.")
         return 1
 
+    except JobCancelled as e:
+        print(f"\n\nStopped: {e}")
+        return 1
+
     except Exception as e:
         print("\n" + "=" * 60)
         print(f"ERROR: {e}")
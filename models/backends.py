@@ -0,0 +1,374 @@
+"""Pluggable image and interpolation backends, and a router that picks between them.
+
+Every backend tracks its own latency, error rate and spend. For each call the
+router ranks the registered backends for the job's SLO ("fastest",
+"cheapest" or "quality") and falls back down the list when one fails. Any
+object with the Backend interface can be registered, which also makes the
+router easy to drive with fake backends offline.
+"""
+
+import os
+import tempfile
+import threading
+import time
+
+import replicate
+
+from utils.cancellation import check, sleep
+
+IMAGE = "image"
+INTERPOLATION = "interpolation"
+
+FASTEST = "fastest"
+CHEAPEST = "cheapest"
+QUALITY = "quality"
+SLOS = (FASTEST, CHEAPEST, QUALITY)
+
+# Backends below this quality are only used when every better one has failed
+DEFAULT_MIN_QUALITY = 0.5
+
+# A backend that fails this many times in a row is skipped for a while
+MAX_CONSECUTIVE_ERRORS = 3
+COOLDOWN_SECONDS = 60
+
+PREDICTION_POLL_SECONDS = 1.0
+
+# A call is abandoned, and the next backend tried, once it takes this many
+# times its expected latency (but never less than MIN_TIME_LIMIT seconds)
+TIME_LIMIT_FACTOR = 6
+MIN_TIME_LIMIT = 30.0
+
+
+class BackendStats:
+    """Running latency, error and cost figures for one backend."""
+
+    def __init__(self, expected_latency, smoothing=0.3):
+        self.latency = expected_latency
+        self.error_rate = 0.0
+        self.smoothing = smoothing
+        self.calls = 0
+        self.errors = 0
+        self.consecutive_errors = 0
+        self.total_cost = 0.0
+        self.last_error_time = 0.0
+        self._lock = threading.Lock()
+
+    def record_success(self, latency, cost):
+        """Fold a successful call into the moving averages."""
+        with self._lock:
+            self.calls += 1
+            self.latency += self.smoothing * (latency - self.latency)
+            self.error_rate -= self.smoothing * self.error_rate
+            self.consecutive_errors = 0
+            self.total_cost += cost
+
+    def record_error(self, latency):
+        """Fold a failed call into the moving averages."""
+        with self._lock:
+            self.calls += 1
+            self.errors += 1
+            # A slow failure still tells us how backed up the queue is
+            self.latency += self.smoothing * (max(latency, self.latency) - self.latency)
+            self.error_rate += self.smoothing * (1.0 - self.error_rate)
+            self.consecutive_errors += 1
+            self.last_error_time = time.time()
+
+    def cooling_down(self):
+        """True while a backend that keeps failing should be left alone."""
+        return (
+            self.consecutive_errors >= MAX_CONSECUTIVE_ERRORS
+            and time.time() - self.last_error_time < COOLDOWN_SECONDS
+        )
+
+    def expected_latency(self):
+        """Latency adjusted for the chance of having to retry elsewhere."""
+        return self.latency / max(0.05, 1.0 - self.error_rate)
+
+
+class Backend:
+    """A model that can serve one kind of call. Subclasses implement run()."""
+
+    def __init__(self, name, kind, cost_per_call=0.0, quality=1.0, expected_latency=10.0,
+                 time_limit=None):
+        self.name = name
+        self.kind = kind
+        self.cost_per_call = cost_per_call
+        self.quality = quality
+        self.time_limit = time_limit or max(MIN_TIME_LIMIT, TIME_LIMIT_FACTOR * expected_latency)
+        self.stats = BackendStats(expected_latency)
+
+    def run(self, token=None, **kwargs):
+        """Serve one call and return a URL or local path to the result.
+
+        Implementations should stop, and cancel any remote work, when the
+        optional CancelToken is cancelled.
+        """
+        raise NotImplementedError(f"{self.name} backend must implement the run() method!")
+
+
+_version_cache = {}
+
+
+def run_prediction(model, input, token=None, official=True, time_limit=None):
+    """Run a Replicate prediction, cancelling it remotely if the token is cancelled.
+
+    Unlike replicate.run, this keeps hold of the prediction so an abandoned
+    job stops running (and billing) on Replicate's side too. A prediction
+    still unfinished after time_limit seconds is cancelled with a TimeoutError.
+    """
+    check(token)
+    start = time.time()
+
+    if official:
+        prediction = replicate.models.predictions.create(model=model, input=input)
+    else:
+        if model not in _version_cache:
+            _version_cache[model] = replicate.models.get(model).latest_version.id
+        prediction = replicate.predictions.create(version=_version_cache[model], input=input)
+
+    handle = token.on_cancel(lambda: _cancel_prediction(prediction)) if token else None
+    try:
+        while prediction.status not in ("succeeded", "failed", "canceled"):
+            if time_limit and time.time() - start > time_limit:
+                raise TimeoutError(
+                    f"Prediction {prediction.id} still {prediction.status} after {time_limit:.0f}s"
+                )
+            sleep(token, PREDICTION_POLL_SECONDS)
+            prediction.reload()
+    except BaseException:
+        # Cancelled, too slow, past the deadline or interrupted: stop paying for it
+        _cancel_prediction(prediction)
+        raise
+    finally:
+        if handle is not None:
+            token.remove(handle)
+
+    if prediction.status == "canceled":
+        check(token)
+        raise ValueError(f"Prediction {prediction.id} was canceled")
+    if prediction.status != "succeeded":
+        raise ValueError(f"Prediction {prediction.id} failed: {prediction.error}")
+
+    return prediction.output
+
+
+def _cancel_prediction(prediction):
+    """Cancel a prediction on Replicate, ignoring ones that have already finished."""
+    try:
+        if prediction.status not in ("succeeded", "failed", "canceled"):
+            prediction.cancel()
+            print(f"  [Router] Cancelled prediction {prediction.id}")
+    except Exception as e:
+        print(f"  [Router] WARNING: could not cancel prediction {prediction.id}: {e}")
+
+
+class ReplicateImageBackend(Backend):
+    """Text-to-image model hosted on Replicate."""
+
+    def __init__(self, name, model, cost_per_call, quality, expected_latency, extra_input=None,
+                 time_limit=None):
+        super().__init__(name, IMAGE, cost_per_call, quality, expected_latency, time_limit)
+        self.model = model
+        self.extra_input = extra_input or {}
+
+    def run(self, prompt, aspect_ratio="16:9", token=None):
+        """Generate an image and return its URL."""
+        output = run_prediction(
+            self.model,
+            dict(self.extra_input, prompt=prompt, aspect_ratio=aspect_ratio),
+            token,
+            time_limit=self.time_limit
+        )
+
+        if output and len(output) > 0:
+            return output[0]
+        else:
+            raise ValueError("No image was generated")
+
+
+class ReplicateInterpolationBackend(Backend):
+    """FILM frame interpolation hosted on Replicate."""
+
+    def __init__(self, name="film", model="google-research/frame-interpolation",
+                 cost_per_call=0.01, quality=1.0, expected_latency=30.0, time_limit=None):
+        super().__init__(name, INTERPOLATION, cost_per_call, quality, expected_latency, time_limit)
+        self.model = model
+
+    def run(self, image1_path, image2_path, times_to_interpolate=4, token=None):
+        """Interpolate between two images and return the URL of the resulting clip."""
+        with open(image1_path, "rb") as frame1, open(image2_path, "rb") as frame2:
+            output = run_prediction(
+                self.model,
+                {
+                    "frame1": frame1,
+                    "frame2": frame2,
+                    "times_to_interpolate": times_to_interpolate
+                },
+                token,
+                official=False,
+                time_limit=self.time_limit
+            )
+
+        if output:
+            if isinstance(output, list):
+                return output[0] if len(output) > 0 else None
+            return output
+        else:
+            raise ValueError("No interpolated frames were generated")
+
+
+class LocalCrossfadeBackend(Backend):
+    """Interpolates on this machine with a plain crossfade: free and instant, but no real motion."""
+
+    def __init__(self, name="local-crossfade", fps=24):
+        super().__init__(name, INTERPOLATION, cost_per_call=0.0, quality=0.2, expected_latency=0.5)
+        self.fps = fps
+
+    def run(self, image1_path, image2_path, times_to_interpolate=4, token=None):
+        """Write a crossfade clip to a temporary file and return its path."""
+        import cv2
+
+        image1 = cv2.imread(image1_path)
+        image2 = cv2.imread(image2_path)
+        if image1 is None or image2 is None:
+            raise ValueError(f"Could not read {image1_path} or {image2_path}")
+
+        height, width = image1.shape[:2]
+        if image2.shape[:2] != (height, width):
+            image2 = cv2.resize(image2, (width, height))
+
+        handle, video_path = tempfile.mkstemp(suffix=".mp4", prefix="vidgen_crossfade_")
+        os.close(handle)
+
+        # Same frame count as FILM: both endpoints plus 2**n - 1 in-between frames
+        steps = 2 ** times_to_interpolate
+        writer = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*'mp4v'), self.fps, (width, height))
+        try:
+            for step in range(steps + 1):
+                check(token)
+                alpha = step / steps
+                writer.write(cv2.addWeighted(image1, 1.0 - alpha, image2, alpha, 0.0))
+        except BaseException:
+            writer.release()
+            os.remove(video_path)
+            raise
+        writer.release()
+
+        return video_path
+
+
+class BackendRouter:
+    """Registry of backends that routes each call to the best one for an SLO."""
+
+    def __init__(self, min_quality=DEFAULT_MIN_QUALITY, verbose=True):
+        self.backends = {}
+        self.min_quality = min_quality
+        self.verbose = verbose
+
+    def register(self, backend):
+        """Add a backend; it becomes a candidate for calls of its kind."""
+        self.backends.setdefault(backend.kind, []).append(backend)
+        return backend
+
+    def rank(self, kind, slo=FASTEST):
+        """Order the backends of a kind from most to least preferred for an SLO."""
+        if slo not in SLOS:
+            raise ValueError(f"Unknown SLO '{slo}'. Choose one of: {', '.join(SLOS)}")
+
+        candidates = self.backends.get(kind, [])
+        if not candidates:
+            raise ValueError(f"No {kind} backends registered")
+
+        def score(backend):
+            stats = backend.stats
+            if slo == CHEAPEST:
+                primary = backend.cost_per_call
+            elif slo == QUALITY:
+                primary = -backend.quality
+            else:
+                primary = stats.expected_latency()
+            return (
+                stats.cooling_down(),
+                backend.quality < self.min_quality,
+                primary,
+                stats.expected_latency()
+            )
+
+        return sorted(candidates, key=score)
+
+    def call(self, kind, slo=FASTEST, token=None, **kwargs):
+        """Run a call on the best backend, falling back to the next one on failure.
+
+        A cancelled token stops the call outright; it is not treated as a
+        backend failure.
+        """
+        last_error = None
+
+        for backend in self.rank(kind, slo):
+            check(token)
+            start = time.time()
+            try:
+                result = backend.run(token=token, **kwargs)
+            except Exception as e:
+                backend.stats.record_error(time.time() - start)
+                self._log(f"{backend.name} failed after {time.time() - start:.1f}s: {e}")
+                last_error = e
+                continue
+
+            backend.stats.record_success(time.time() - start, backend.cost_per_call)
+            self._log(f"{kind} via {backend.name} in {time.time() - start:.1f}s")
+            return result
+
+        raise last_error
+
+    def summary(self):
+        """One line per backend with its calls, latency, error rate and spend."""
+        lines = []
+        for kind, backends in self.backends.items():
+            for backend in backends:
+                stats = backend.stats
+                lines.append(
+                    f"{kind:<13} {backend.name:<18} calls: {stats.calls:<4} "
+                    f"latency: {stats.latency:5.1f}s  errors: {stats.error_rate:4.0%}  "
+                    f"cost: ${stats.total_cost:.3f}"
+                )
+        return lines
+
+    def _log(self, message):
+        """Print a routing decision."""
+        if self.verbose:
+            print(f"  [Router] {message}")
+
+
+def default_backends():
+    """The Replicate models VidGen knows about, plus the local fallback."""
+    return [
+        ReplicateImageBackend(
+            "flux-schnell", "black-forest-labs/flux-schnell",
+            cost_per_call=0.003, quality=0.7, expected_latency=5.0,
+            extra_input={"output_format": "png", "output_quality": 90,
+                         "num_outputs": 1, "go_fast": True}
+        ),
+        ReplicateImageBackend(
+            "flux-dev", "black-forest-labs/flux-dev",
+            cost_per_call=0.025, quality=0.9, expected_latency=20.0,
+            extra_input={"output_format": "png", "output_quality": 90, "num_outputs": 1}
+        ),
+        ReplicateInterpolationBackend(),
+        LocalCrossfadeBackend(),
+    ]
+
+
+_default_router = None
+_default_router_lock = threading.Lock()
+
+
+def default_router():
+    """Process-wide router over the default backends, so stats are shared by all clients."""
+    global _default_router
+    with _default_router_lock:
+        if _default_router is None:
+            _default_router = BackendRouter()
+            for backend in default_backends():
+                _default_router.register(backend)
+        return _default_router
@@ -1,21 +1,135 @@
 """Wrapper for the Claude API with text and vision capabilities."""
 
 import os
+import io
 import base64
+import hashlib
 import json
+import threading
+from collections import OrderedDict
 from dotenv import load_dotenv
+from PIL import Image
+from pydantic import ValidationError
 import anthropic
 
+from utils.cancellation import check
+
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 ENV_PATH = os.path.join(PROJECT_ROOT, ".env")
 load_dotenv(ENV_PATH, override=True)
 
+MEDIA_TYPES = {
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".gif": "image/gif",
+    ".webp": "image/webp"
+}
+
+# Longest edge Claude uses without downscaling the image itself
+DEFAULT_IMAGE_MAX_DIMENSION = 1568
+DEFAULT_IMAGE_QUALITY = 85
+MAX_IMAGES_PER_REQUEST = 20
+
+# Ceiling for retrying a truncated structured response with a larger budget
+MAX_OUTPUT_TOKENS = 32000
+# Passed explicitly so the SDK accepts large max_tokens without streaming
+REQUEST_TIMEOUT = 600
+
+TRUNCATED = "the response was cut off before the JSON was complete"
+
+USAGE_FIELDS = (
+    "input_tokens",
+    "output_tokens",
+    "cache_creation_input_tokens",
+    "cache_read_input_tokens",
+)
+
+
+def cached_text(text):
+    """Text block marked as the end of a cacheable prompt prefix.
+
+    Everything up to and including this block is cached by the API for a few
+    minutes. Prefixes shorter than the model's minimum (1024 tokens for Sonnet)
+    are accepted but not cached.
+    """
+    return {"type": "text", "text": text, "cache_control": {"type": "ephemeral"}}
+
+
+class _LRUCache:
+    """Small thread-safe least-recently-used cache."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return a cached value, or None."""
+        with self._lock:
+            if key not in self._items:
+                return None
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def put(self, key, value):
+        """Store a value, evicting the least recently used one if full."""
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+
+def _shrink_image(image_data, media_type, max_dimension, quality):
+    """Downscale and recompress image bytes, returning (media_type, bytes).
+
+    Images that already fit and are already compressed are sent untouched, as
+    are animated GIFs. Images with transparency stay PNG; everything else is
+    re-encoded as JPEG at the given quality.
+    """
+    if not max_dimension:
+        return media_type, image_data
+
+    with Image.open(io.BytesIO(image_data)) as img:
+        if getattr(img, "is_animated", False):
+            return media_type, image_data
+
+        needs_resize = max(img.size) > max_dimension
+        if not needs_resize and media_type in ("image/jpeg", "image/webp"):
+            return media_type, image_data
+
+        img.load()
+        if needs_resize:
+            img.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+
+        buffer = io.BytesIO()
+        if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+            img.save(buffer, format="PNG", optimize=True)
+            result = ("image/png", buffer.getvalue())
+        else:
+            img.convert("RGB").save(buffer, format="JPEG", quality=quality, optimize=True)
+            result = ("image/jpeg", buffer.getvalue())
+
+    # Never send a larger payload than the original
+    if not needs_resize and len(result[1]) >= len(image_data):
+        return media_type, image_data
+    return result
+
 
 class ClaudeClient:
     """Wrapper for the Claude API with support for text and vision."""
 
-    def __init__(self, model="claude-sonnet-4-20250514"):
-        """Initialize Claude client with API key from environment."""
+    def __init__(self, model="claude-sonnet-4-20250514",
+                 image_max_dimension=DEFAULT_IMAGE_MAX_DIMENSION,
+                 image_quality=DEFAULT_IMAGE_QUALITY, image_cache_size=64):
+        """Initialize Claude client with API key from environment.
+
+        Images are downscaled so their longest edge is at most image_max_dimension
+        (None sends the original files) and recompressed at image_quality.
+        """
         api_key = os.getenv("ANTHROPIC_API_KEY")
 
         if not api_key:
@@ -27,112 +141,264 @@ class ClaudeClient:
         self.client = anthropic.Anthropic(api_key=api_key)
         self.model = model
 
-    def send_message(self, prompt, max_tokens=4096):
-        """Send a text prompt and return Claude's response."""
-        message = self.client.messages.create(
-            model=self.model,
+        self.image_max_dimension = image_max_dimension
+        self.image_quality = image_quality
+        self._image_cache = _LRUCache(image_cache_size)
+
+        # Set by the orchestrator so calls stop at the job's deadline or on cancel
+        self.token = None
+
+        self.usage = {field: 0 for field in USAGE_FIELDS}
+        self.last_usage = dict(self.usage)
+        self._usage_lock = threading.Lock()
+
+    def send_message(self, prompt, max_tokens=4096, system=None):
+        """Send a prompt and return Claude's response.
+
+        prompt and system may each be a string or a list of content blocks;
+        use cached_text() to mark static prefixes for prompt caching.
+        """
+        message = self._create(
             max_tokens=max_tokens,
+            system=system,
             messages=[{"role": "user", "content": prompt}]
         )
         return message.content[0].text
 
+    def _create(self, system=None, **kwargs):
+        """Call the Messages API and record token usage, honouring the job's deadline."""
+        if system:
+            kwargs["system"] = system
+
+        check(self.token)
+        client = self.client
+        kwargs["timeout"] = REQUEST_TIMEOUT
+        remaining = self.token.remaining() if self.token is not None else None
+        if remaining is not None:
+            # The SDK's own retries would each get the full timeout again
+            kwargs["timeout"] = max(1.0, min(REQUEST_TIMEOUT, remaining))
+            client = self.client.with_options(max_retries=0)
+
+        try:
+            message = client.messages.create(model=self.model, **kwargs)
+        except anthropic.APITimeoutError:
+            # A timeout caused by the deadline is a cancellation, not an API failure
+            check(self.token)
+            raise
+
+        self._record_usage(message)
+        check(self.token)
+        return message
+
+    def _record_usage(self, message):
+        """Add a response's token counts, including cache reads and writes, to the totals."""
+        usage = getattr(message, "usage", None)
+        counts = {field: getattr(usage, field, 0) or 0 for field in USAGE_FIELDS}
+
+        with self._usage_lock:
+            self.last_usage = counts
+            for field, count in counts.items():
+                self.usage[field] += count
+
     def send_message_with_image(self, prompt, image_path, max_tokens=4096):
         """Send a prompt with an image and return Claude's response."""
-        with open(image_path, "rb") as f:
-            image_data = f.read()
+        return self.send_message_with_images(prompt, [image_path], max_tokens)
 
-        image_base64 = base64.standard_b64encode(image_data).decode("utf-8")
-
-        extension = os.path.splitext(image_path)[1].lower()
-        media_types = {
-            ".png": "image/png",
-            ".jpg": "image/jpeg",
-            ".jpeg": "image/jpeg",
-            ".gif": "image/gif",
-            ".webp": "image/webp"
-        }
-        media_type = media_types.get(extension, "image/png")
+    def send_message_with_images(self, prompt, image_paths, max_tokens=4096, label_images=False):
+        """Send a prompt with multiple images and return Claude's response."""
+        content = self.build_image_content(image_paths, label_images)
+        content.append({"type": "text", "text": prompt})
 
-        message = self.client.messages.create(
-            model=self.model,
+        message = self._create(
             max_tokens=max_tokens,
-            messages=[{
-                "role": "user",
-                "content": [
-                    {
-                        "type": "image",
-                        "source": {
-                            "type": "base64",
-                            "media_type": media_type,
-                            "data": image_base64
-                        }
-                    },
-                    {"type": "text", "text": prompt}
-                ]
-            }]
+            messages=[{"role": "user", "content": content}]
         )
 
         return message.content[0].text
 
-    def send_message_with_images(self, prompt, image_paths, max_tokens=4096):
-        """Send a prompt with multiple images and return Claude's response."""
-        content = []
+    def send_image_batches(self, prompt, image_paths, batch_size=MAX_IMAGES_PER_REQUEST,
+                           max_tokens=4096):
+        """Review a whole image set in as few requests as possible, one response per batch.
+
+        Each image is preceded by its filename so responses can refer to it.
+        """
+        responses = []
+        for start in range(0, len(image_paths), batch_size):
+            batch = image_paths[start:start + batch_size]
+            responses.append(
+                self.send_message_with_images(prompt, batch, max_tokens, label_images=True)
+            )
+        return responses
 
+    def build_image_content(self, image_paths, label_images=False):
+        """Build the content blocks for a list of images."""
+        content = []
         for image_path in image_paths:
-            with open(image_path, "rb") as f:
-                image_data = f.read()
+            if label_images:
+                content.append({"type": "text", "text": f"Image: {os.path.basename(image_path)}"})
+            content.append(self.encode_image(image_path))
+        return content
 
-            image_base64 = base64.standard_b64encode(image_data).decode("utf-8")
+    def encode_image(self, image_path):
+        """Return an image content block, downscaled and recompressed for upload.
 
-            extension = os.path.splitext(image_path)[1].lower()
-            media_types = {
-                ".png": "image/png",
-                ".jpg": "image/jpeg",
-                ".jpeg": "image/jpeg",
-                ".gif": "image/gif",
-                ".webp": "image/webp"
-            }
-            media_type = media_types.get(extension, "image/png")
+        Encoded payloads are cached by file hash and target size, so the same
+        keyframe reviewed twice is only resized and encoded once.
+        """
+        with open(image_path, "rb") as f:
+            image_data = f.read()
 
-            content.append({
+        key = (hashlib.sha256(image_data).hexdigest(), self.image_max_dimension, self.image_quality)
+        block = self._image_cache.get(key)
+
+        if block is None:
+            extension = os.path.splitext(image_path)[1].lower()
+            media_type, payload = _shrink_image(
+                image_data,
+                MEDIA_TYPES.get(extension, "image/png"),
+                self.image_max_dimension,
+                self.image_quality
+            )
+            block = {
                 "type": "image",
                 "source": {
                     "type": "base64",
                     "media_type": media_type,
-                    "data": image_base64
+                    "data": base64.standard_b64encode(payload).decode("utf-8")
                 }
-            })
+            }
+            self._image_cache.put(key, block)
 
-        content.append({"type": "text", "text": prompt})
+        return block
+
+    def send_structured(self, prompt, max_tokens=4096, system=None, schema=None, max_repairs=1):
+        """Send a prompt and parse the JSON response.
+
+        With a Pydantic schema, Claude is forced to answer through a tool whose
+        input is that schema, and the result is validated and returned as a
+        dict with defaults filled in. Malformed or invalid output gets up to
+        max_repairs short repair requests before giving up; a truncated one is
+        asked for again with twice the token budget.
+        """
+        request = prompt
+        for attempt in range(max_repairs + 1):
+            if schema is not None:
+                raw, data, error = self._request_tool_output(request, max_tokens, system, schema)
+            else:
+                raw, data, error = self._request_text_output(request, max_tokens, system)
 
-        message = self.client.messages.create(
-            model=self.model,
+            if error is None and schema is not None:
+                try:
+                    return schema.model_validate(data).model_dump()
+                except ValidationError as e:
+                    error = _format_validation_error(e)
+            elif error is None:
+                return data
+
+            if attempt < max_repairs and error == TRUNCATED:
+                # Quoting the partial answer back would only be cut off again
+                if max_tokens >= MAX_OUTPUT_TOKENS:
+                    break
+                max_tokens = min(max_tokens * 2, MAX_OUTPUT_TOKENS)
+                request = prompt
+            elif attempt < max_repairs:
+                request = self._repair_prompt(prompt, raw, error)
+
+        raise ValueError(
+            f"Failed to parse JSON from Claude's response.\n"
+            f"Error: {error}\n"
+            f"Response: {raw[:500]}..."
+        )
+
+    def _request_text_output(self, prompt, max_tokens, system):
+        """Ask for JSON as plain text; returns (raw text, data, error)."""
+        message = self._create(
             max_tokens=max_tokens,
-            messages=[{"role": "user", "content": content}]
+            system=system,
+            messages=[{"role": "user", "content": prompt}]
         )
+        raw = message.content[0].text
 
-        return message.content[0].text
+        if message.stop_reason == "max_tokens":
+            return raw, None, TRUNCATED
 
-    def send_structured(self, prompt, max_tokens=4096):
-        """Send a prompt and parse the JSON response."""
-        text_response = self.send_message(prompt, max_tokens)
-        text = text_response.strip()
+        try:
+            return raw, _parse_json(raw), None
+        except ValueError as e:
+            return raw, None, str(e)
 
-        if text.startswith("```json"):
-            text = text[7:]
-        elif text.startswith("```"):
-            text = text[3:]
+    def _request_tool_output(self, prompt, max_tokens, system, schema):
+        """Force the answer through a tool built from the schema; returns (raw, data, error)."""
+        tool_name = f"submit_{schema.__name__.lower()}"
 
-        if text.endswith("```"):
-            text = text[:-3]
+        message = self._create(
+            max_tokens=max_tokens,
+            system=system,
+            tools=[{
+                "name": tool_name,
+                "description": f"Submit the {schema.__name__} JSON.",
+                "input_schema": schema.model_json_schema()
+            }],
+            tool_choice={"type": "tool", "name": tool_name},
+            messages=[{"role": "user", "content": prompt}]
+        )
 
-        text = text.strip()
+        for block in message.content:
+            if block.type == "tool_use":
+                raw = json.dumps(block.input)
+                if message.stop_reason == "max_tokens":
+                    return raw, None, TRUNCATED
+                return raw, block.input, None
 
+        # Fall back to parsing any text the model returned instead
+        raw = "".join(block.text for block in message.content if block.type == "text")
         try:
-            return json.loads(text)
-        except json.JSONDecodeError as e:
-            raise ValueError(
-                f"Failed to parse JSON from Claude's response.\n"
-                f"Error: {e}\n"
-                f"Response: {text_response[:500]}..."
-            )
+            return raw, _parse_json(raw), None
+        except ValueError as e:
+            return raw, None, str(e)
+
+    def _repair_prompt(self, prompt, raw, error):
+        """Ask Claude to fix its previous answer rather than start from scratch."""
+        return f"""{prompt}
+
+Your previous response could not be used: {error}
+
+Previous response:
+{raw[:8000]}
+
+Return the corrected, complete JSON only. Keep everything that was already correct."""
+
+
+def _parse_json(text):
+    """Parse JSON from a response, tolerating code fences and surrounding prose."""
+    text = text.strip()
+
+    if text.startswith("```json"):
+        text = text[7:]
+    elif text.startswith("```"):
+        text = text[3:]
+
+    if text.endswith("```"):
+        text = text[:-3]
+
+    text = text.strip()
+
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError as e:
+        start, end = text.find("{"), text.rfind("}")
+        if start != -1 and end > start:
+            try:
+                return json.loads(text[start:end + 1])
+            except json.JSONDecodeError:
+                pass
+        raise ValueError(f"invalid JSON ({e})")
+
+
+def _format_validation_error(error):
+    """Summarize a Pydantic ValidationError as 'field.path: message' pairs."""
+    problems = []
+    for item in error.errors():
+        location = ".".join(str(part) for part in item["loc"]) or "response"
+        problems.append(f"{location}: {item['msg']}")
+    return "; ".join(problems)
@@ -1,9 +1,12 @@
 """Wrapper for the Replicate API to handle image generation and frame interpolation."""
 
 import os
+import shutil
 import requests
 from dotenv import load_dotenv
-import replicate
+
+from models.backends import default_router, IMAGE, INTERPOLATION, FASTEST
+from utils.cancellation import check
 
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 ENV_PATH = os.path.join(PROJECT_ROOT, ".env")
@@ -11,64 +14,70 @@ load_dotenv(ENV_PATH, override=True)
 
 
 class ReplicateClient:
-    """Wrapper for the Replicate API supporting Flux image generation and FILM interpolation."""
+    """Image generation and frame interpolation, routed across the registered backends.
+
+    By default calls go to Replicate (Flux for images, FILM for interpolation),
+    with a local crossfade as the last-resort interpolation fallback. Pass a
+    BackendRouter to use other backends, including fakes for offline tests.
+    """
+
+    def __init__(self, router=None, slo=FASTEST):
+        """Initialize the client; slo is 'fastest', 'cheapest' or 'quality'."""
+        if router is None:
+            token = os.getenv("REPLICATE_API_TOKEN")
+            if not token:
+                raise ValueError(
+                    "REPLICATE_API_TOKEN not found. "
+                    "Make sure you have a .env file with your API token."
+                )
+            router = default_router()
 
-    def __init__(self):
-        """Initialize Replicate client with API token from environment."""
-        token = os.getenv("REPLICATE_API_TOKEN")
-        if not token:
-            raise ValueError(
-                "REPLICATE_API_TOKEN not found. "
-                "Make sure you have a .env file with your API token."
-            )
+        self.router = router
+        self.slo = slo
+
+        # Set by the orchestrator so predictions are cancelled with the job
+        self.token = None
 
     def generate_image(self, prompt, aspect_ratio="16:9"):
-        """Generate an image from a text prompt using Flux Schnell."""
-        output = replicate.run(
-            "black-forest-labs/flux-schnell",
-            input={
-                "prompt": prompt,
-                "aspect_ratio": aspect_ratio,
-                "output_format": "png",
-                "output_quality": 90,
-                "num_outputs": 1,
-                "go_fast": True
-            }
+        """Generate an image from a text prompt and return its URL."""
+        return self.router.call(
+            IMAGE, self.slo, token=self.token, prompt=prompt, aspect_ratio=aspect_ratio
         )
 
-        if output and len(output) > 0:
-            return output[0]
-        else:
-            raise ValueError("No image was generated")
-
     def download_image(self, url, save_path):
-        """Download an image from URL and save to disk."""
+        """Download an image (or video) from URL and save to disk; local paths are moved.
+
+        The file is written next to save_path and renamed into place, so an
+        interrupted download never looks like a finished one on resume.
+        """
         folder = os.path.dirname(save_path)
         if folder:
             os.makedirs(folder, exist_ok=True)
 
-        response = requests.get(url)
-        response.raise_for_status()
+        temp_path = save_path + ".part"
+
+        # Local backends return files on disk rather than URLs
+        if os.path.isfile(str(url)):
+            shutil.move(str(url), temp_path)
+        else:
+            check(self.token)
+            remaining = self.token.remaining() if self.token else None
+            response = requests.get(str(url), timeout=max(1.0, remaining) if remaining is not None else None)
+            response.raise_for_status()
 
-        with open(save_path, 'wb') as f:
-            f.write(response.content)
+            with open(temp_path, 'wb') as f:
+                f.write(response.content)
 
+        os.replace(temp_path, save_path)
         return save_path
 
-    def interpolate_frames(self, image1_path, image2_path):
-        """Generate intermediate frames between two images using FILM model."""
-        output = replicate.run(
-            "google-research/frame-interpolation",
-            input={
-                "frame1": open(image1_path, "rb"),
-                "frame2": open(image2_path, "rb"),
-                "times_to_interpolate": 4
-            }
+    def interpolate_frames(self, image1_path, image2_path, times_to_interpolate=4):
+        """Generate intermediate frames between two images and return the clip's URL."""
+        return self.router.call(
+            INTERPOLATION,
+            self.slo,
+            token=self.token,
+            image1_path=image1_path,
+            image2_path=image2_path,
+            times_to_interpolate=times_to_interpolate
         )
-
-        if output:
-            if isinstance(output, list):
-                return output[0] if len(output) > 0 else None
-            return output
-        else:
-            raise ValueError("No interpolated frames were generated")
@@ -0,0 +1,86 @@
+"""Pydantic schemas for the JSON produced by the Director and Scene agents."""
+
+from typing import List, Optional
+
+from pydantic import BaseModel, ConfigDict, Field, model_validator
+
+
+class _Schema(BaseModel):
+    """Base schema that ignores unexpected fields instead of rejecting them."""
+
+    model_config = ConfigDict(extra="ignore")
+
+
+class Shot(_Schema):
+    """A single shot in the director's plan."""
+
+    shot_number: int
+    type: str = "medium"
+    duration: float = 1.0
+    description: str
+    camera_movement: str = "static"
+    elements: List[str] = Field(default_factory=list)
+
+
+class ShotPlan(_Schema):
+    """The director's plan: title, style and an ordered list of shots."""
+
+    title: str = "Untitled"
+    total_duration: Optional[float] = None
+    style: str = "cinematic"
+    shots: List[Shot] = Field(min_length=1)
+
+    @model_validator(mode="after")
+    def fill_total_duration(self):
+        """Derive the total duration from the shots when it is missing."""
+        if not self.total_duration:
+            self.total_duration = sum(shot.duration for shot in self.shots)
+        return self
+
+
+class Keyframe(_Schema):
+    """A keyframe image prompt produced by the scene agent."""
+
+    keyframe_id: str
+    shot_number: int
+    timestamp: float = 0.0
+    prompt: str
+    negative_prompt: str = ""
+    elements: List[str] = Field(default_factory=list)
+    notes: str = ""
+
+
+class SceneData(_Schema):
+    """The scene agent's output: keyframe prompts in playback order."""
+
+    title: str = "Untitled"
+    style: str = "cinematic"
+    keyframes: List[Keyframe] = Field(min_length=1)
+
+
+class Act(_Schema):
+    """One act of a long-form plan and the shots it contains."""
+
+    act_number: int
+    title: str = ""
+    summary: str = ""
+    shots: List[Shot] = Field(min_length=1)
+
+
+class LongFormPlan(_Schema):
+    """A long-form director plan: acts first, each broken into shots."""
+
+    title: str = "Untitled"
+    total_duration: Optional[float] = None
+    style: str = "cinematic"
+    style_digest: str = ""
+    acts: List[Act] = Field(min_length=1)
+
+    @model_validator(mode="after")
+    def fill_total_duration(self):
+        """Derive the total duration from the shots when it is missing."""
+        if not self.total_duration:
+            self.total_duration = sum(
+                shot.duration for act in self.acts for shot in act.shots
+            )
+        return self
@@ -3,7 +3,6 @@
 import os
 import sys
 import glob
-import re
 
 PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
 if PROJECT_ROOT not in sys.path:
@@ -13,8 +12,14 @@ from agents.director import DirectorAgent
 from agents.scene import SceneAgent
 from agents.keyframe import KeyframeAgent
 from agents.interpolation import InterpolationAgent
-from utils.file_io import save_json, load_json, create_project_folder, get_project_path
-from utils.video import images_to_video, frames_to_video
+from utils.file_io import (
+    save_json, load_json, create_project_folder, get_project_path, create_project_id
+)
+from utils.video import encode_renditions
+from utils.hls import HLSWriter
+from utils.frame_manifest import MANIFEST_NAME
+from models.backends import FASTEST, SLOS
+from utils.cancellation import CancelToken, JobCancelled
 
 
 class Orchestrator:
@@ -30,59 +35,201 @@ class Orchestrator:
         self.scene = SceneAgent()
         self.keyframe = KeyframeAgent()
         self.interpolation = InterpolationAgent()
-
-    def run(self, user_prompt):
-        """Generate a video from a text prompt."""
-        project_id = self._create_project_id(user_prompt)
-
+        self.stream = None
+        self.token = None
+
+    def run(self, user_prompt, stream=False, remux_stream=False, long_form=False,
+            target_duration=60, keep_frames=None, slo=FASTEST, deadline=None,
+            token=None, project_id=None):
+        """Generate a video from a text prompt.
+
+        With stream=True, each interpolated segment is also published to a
+        live HLS playlist (stream.m3u8) as soon as it is ready, so playback
+        can start before the video is finished. remux_stream additionally
+        joins the segments into stream.mp4 at the end.
+
+        long_form plans a video of about target_duration seconds as acts of
+        shots. Interpolated clips are deleted after encoding unless
+        keep_frames is set (it defaults to True for short videos only).
+
+        slo ('fastest', 'cheapest' or 'quality') decides which image and
+        interpolation backends the router prefers for this job.
+
+        deadline is a time limit in seconds; token is a CancelToken to cancel
+        the job from elsewhere. Either way, in-flight predictions are cancelled
+        on Replicate and everything finished so far is kept, so passing the
+        same project_id later resumes the job where it stopped.
+        """
+        # Reject a bad SLO before the planning calls are paid for
+        if slo not in SLOS:
+            raise ValueError(f"Unknown SLO '{slo}'. Choose one of: {', '.join(SLOS)}")
+
+        self.token = token or CancelToken(deadline)
+        for agent in (self.director, self.scene, self.keyframe, self.interpolation):
+            agent.set_token(self.token)
+
+        project_id = project_id or self._create_project_id(user_prompt)
+
+        try:
+            return self._run(
+                project_id, user_prompt, stream, remux_stream, long_form,
+                target_duration, keep_frames, slo
+            )
+        except (JobCancelled, KeyboardInterrupt) as e:
+            # Stop remote work still running for this job, then leave the artifacts for a resume
+            self.token.cancel(str(e) or "interrupted")
+            print(f"\nJob stopped ({self.token.reason}). Resume with: python main.py --resume={project_id}")
+            raise
+
+    def cancel(self, reason="cancelled"):
+        """Cancel the running job from another thread."""
+        if self.token is not None:
+            self.token.cancel(reason)
+
+    def _run(self, project_id, user_prompt, stream, remux_stream, long_form,
+             target_duration, keep_frames, slo):
+        """Run (or resume) every pipeline step for a project."""
         print(f"\nProject: {project_id}")
         print(f"Prompt: {user_prompt}")
         print("=" * 60 + "\n")
 
         project_folder = create_project_folder(project_id)
 
+        # A finished run whose clips were cleaned up has nothing left to resume
+        final_path = get_project_path(project_id, "final.mp4")
+        interpolated_manifest = get_project_path(project_id, os.path.join("4_interpolated", MANIFEST_NAME))
+        if os.path.exists(final_path) and not os.path.exists(interpolated_manifest):
+            print(f"Project already complete: {final_path}")
+            return final_path
+
+        self.keyframe.replicate.slo = slo
+        self.interpolation.replicate.slo = slo
+
+        # Set up streaming first so a missing ffmpeg fails before any API spend
+        self.stream = HLSWriter(project_folder, fps=24) if stream else None
+        if self.stream:
+            print(f"Streaming to: {self.stream.playlist_path}\n")
+
         print("STEP 1: Planning shots...")
-        shot_plan = self.director.run(user_prompt)
         director_path = get_project_path(project_id, "1_director.json")
-        save_json(shot_plan, director_path)
+        if os.path.exists(director_path):
+            print("Reusing saved shot plan")
+            shot_plan = load_json(director_path)
+        else:
+            if not user_prompt:
+                raise ValueError(f"No saved shot plan for {project_id}; pass the prompt again")
+            shot_plan = self.director.run(user_prompt, long_form=long_form, target_duration=target_duration)
+            save_json(shot_plan, director_path)
 
         print("\nSTEP 2: Creating detailed prompts...")
-        scene_data = self.scene.run(shot_plan)
         scene_path = get_project_path(project_id, "2_scene.json")
-        save_json(scene_data, scene_path)
+        if os.path.exists(scene_path):
+            print("Reusing saved prompts")
+            scene_data = load_json(scene_path)
+        else:
+            scene_data = self.scene.run(shot_plan)
+            save_json(scene_data, scene_path)
 
         print("\nSTEP 3: Generating images...")
         keyframes_folder = get_project_path(project_id, "3_keyframes")
-        generated_images = self.keyframe.run(scene_data, keyframes_folder)
-        keyframe_paths = sorted(glob.glob(os.path.join(keyframes_folder, "*.png")))
+        # Keep scene order; sorting filenames would put shot10 before shot2
+        keyframe_paths = self.keyframe.run(scene_data, keyframes_folder)
 
         print("\nSTEP 4: Creating smooth transitions...")
         interpolated_folder = get_project_path(project_id, "4_interpolated")
-        all_frames = self.interpolation.run(keyframe_paths, interpolated_folder)
+        manifest = self.interpolation.run(
+            keyframe_paths,
+            interpolated_folder,
+            on_segment=self._stream_segment if self.stream else None
+        )
 
+        self.token.check()
         print("\nSTEP 5: Assembling video...")
-        video_path = get_project_path(project_id, "final.mp4")
-        frames_to_video(interpolated_folder, video_path, fps=24)
+        # A single keyframe has nothing to interpolate, so it becomes the whole video
+        video_frames = manifest if manifest.frame_count else keyframe_paths
+        renditions = encode_renditions(video_frames, project_folder, fps=24)
+        video_path = renditions["full"]
 
-        video_frames = sorted(glob.glob(os.path.join(interpolated_folder, "*.png")))
+        if self.stream:
+            self._finish_stream(video_frames, project_id, remux_stream)
+
+        if keep_frames is None:
+            keep_frames = not long_form
+        if not keep_frames:
+            self._remove_frames(interpolated_folder)
 
         print("\n" + "=" * 60)
         print("VIDEO GENERATION COMPLETE!")
         print("=" * 60)
         print(f"\nOutput: {video_path}")
-        print(f"Keyframes: {len(keyframe_paths)} | Total frames: {len(video_frames)}")
+        for name, path in renditions.items():
+            if name != "full":
+                print(f"  {name}: {path}")
+        print(f"Keyframes: {len(keyframe_paths)} | Total frames: {manifest.frame_count or len(keyframe_paths)}")
+        self._print_token_usage()
+        self._print_backend_usage()
 
         return video_path
 
+    def _remove_frames(self, interpolated_folder):
+        """Delete the interpolated clips once every output has been encoded.
+
+        The manifest goes too, so nothing is left pointing at the deleted clips
+        and a later resume sees a finished project rather than re-running FILM.
+        """
+        removed = 0
+        for path in glob.glob(os.path.join(interpolated_folder, "segment_*.mp4")):
+            os.remove(path)
+            removed += 1
+
+        manifest_path = os.path.join(interpolated_folder, MANIFEST_NAME)
+        if os.path.exists(manifest_path):
+            os.remove(manifest_path)
+
+        print(f"Removed {removed} interpolated clips")
+
+    def _stream_segment(self, frames):
+        """Publish a finished segment; a streaming failure never stops the render."""
+        try:
+            self.stream.add_segment(frames)
+        except Exception as e:
+            print(f"WARNING: streaming disabled ({e})")
+            self.stream = None
+
+    def _finish_stream(self, video_frames, project_id, remux_stream):
+        """Close the live playlist, optionally remuxing it into a single MP4."""
+        try:
+            # A single keyframe has no segments, so stream the whole video at once
+            if not self.stream.segments:
+                self.stream.add_segment(video_frames)
+
+            remux_path = get_project_path(project_id, "stream.mp4") if remux_stream else None
+            print(f"Stream: {self.stream.finalize(remux_path)}")
+        except Exception as e:
+            print(f"WARNING: could not finalize stream ({e})")
+
+    def _print_token_usage(self):
+        """Print Claude token usage across agents, including prompt cache reads and writes."""
+        totals = {}
+        for agent in (self.director, self.scene):
+            for field, count in agent.claude.usage.items():
+                totals[field] = totals.get(field, 0) + count
+
+        print(
+            f"Claude tokens: {totals['input_tokens']} in | {totals['output_tokens']} out | "
+            f"cache write {totals['cache_creation_input_tokens']} | "
+            f"cache read {totals['cache_read_input_tokens']}"
+        )
+
+    def _print_backend_usage(self):
+        """Print latency, error rate and spend for each image/interpolation backend."""
+        print("Backends:")
+        for line in self.keyframe.replicate.router.summary():
+            print(f"  {line}")
+
     def _create_project_id(self, prompt):
         """Create a safe folder name from the prompt with timestamp."""
-        import time
-
-        short = prompt[:30].lower()
-        safe = re.sub(r'[^a-z0-9]+', '_', short).strip('_')
-        timestamp = int(time.time())
-
-        return f"{safe}_{timestamp}"
+        return create_project_id(prompt)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,110 @@
+"""Cancellation tokens and deadlines shared by every stage of a job."""
+
+import threading
+import time
+
+
+class JobCancelled(BaseException):
+    """Raised when a job is cancelled or runs past its deadline.
+
+    Like KeyboardInterrupt it derives from BaseException, so the pipeline's
+    broad `except Exception` fallbacks let it through instead of carrying on.
+    """
+
+
+class CancelToken:
+    """Tells long-running work to stop, either on request or when a deadline passes.
+
+    Callbacks registered with on_cancel() run once, on cancellation, from
+    whichever thread cancels; clients use them to cancel remote work that is
+    already in flight.
+    """
+
+    def __init__(self, timeout=None):
+        """Create a token, optionally expiring `timeout` seconds from now."""
+        self.deadline = time.time() + timeout if timeout else None
+        self.reason = None
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = {}
+        self._next_handle = 0
+        self._timer = None
+
+        if timeout:
+            self._timer = threading.Timer(timeout, self.cancel, args=("deadline exceeded",))
+            self._timer.daemon = True
+            self._timer.start()
+
+    @property
+    def cancelled(self):
+        """True once the token is cancelled or its deadline has passed."""
+        if not self._event.is_set() and self.deadline and time.time() >= self.deadline:
+            self.cancel("deadline exceeded")
+        return self._event.is_set()
+
+    def cancel(self, reason="cancelled"):
+        """Cancel the token and run every registered callback."""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks = list(self._callbacks.values())
+            self._callbacks.clear()
+
+        if self._timer is not None:
+            self._timer.cancel()
+
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"WARNING: cancel callback failed: {e}")
+
+    def check(self):
+        """Raise JobCancelled if the job should stop."""
+        if self.cancelled:
+            raise JobCancelled(self.reason)
+
+    def remaining(self):
+        """Seconds left before the deadline, or None if there is none."""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.time())
+
+    def sleep(self, seconds):
+        """Sleep like time.sleep, but wake up and raise as soon as the job is cancelled."""
+        self._event.wait(seconds)
+        self.check()
+
+    def on_cancel(self, callback):
+        """Register a callback to run on cancellation; returns a handle for remove()."""
+        with self._lock:
+            if not self._event.is_set():
+                handle = self._next_handle
+                self._next_handle += 1
+                self._callbacks[handle] = callback
+                return handle
+
+        # Already cancelled: run it straight away
+        callback()
+        return None
+
+    def remove(self, handle):
+        """Unregister a callback once the work it would cancel has finished."""
+        with self._lock:
+            self._callbacks.pop(handle, None)
+
+
+def check(token):
+    """Check a token that may be None."""
+    if token is not None:
+        token.check()
+
+
+def sleep(token, seconds):
+    """Sleep, waking early if a (possibly None) token is cancelled."""
+    if token is None:
+        time.sleep(seconds)
+    else:
+        token.sleep(seconds)
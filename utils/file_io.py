@@ -2,9 +2,13 @@
 
 import json
 import os
+import re
+import time
 
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-OUTPUT_DIR = os.path.join(PROJECT_ROOT, "output")
+
+# Point VIDGEN_OUTPUT_DIR at shared storage when running distributed workers
+OUTPUT_DIR = os.getenv("VIDGEN_OUTPUT_DIR", os.path.join(PROJECT_ROOT, "output"))
 
 
 def save_json(data, path):
@@ -37,3 +41,12 @@ def create_project_folder(project_id):
 def get_project_path(project_id, filename):
     """Get full path for a file within a project."""
     return os.path.join(OUTPUT_DIR, project_id, filename)
+
+
+def create_project_id(prompt):
+    """Create a safe folder name from the prompt with timestamp."""
+    short = prompt[:30].lower()
+    safe = re.sub(r'[^a-z0-9]+', '_', short).strip('_')
+    timestamp = int(time.time())
+
+    return f"{safe}_{timestamp}"
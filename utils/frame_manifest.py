@@ -0,0 +1,183 @@
+"""Frame sequence manifests that describe a video's frames without copying them.
+
+A manifest lists, segment by segment, where every frame comes from:
+
+    image      a still image (e.g. a keyframe, referenced in place), shown `hold` times
+    video      a run of frames from a video file, e.g. FILM's interpolated clip,
+               each shown `repeat` times
+    crossfade  `count` frames blended between two images, computed when read
+
+Paths are stored relative to the manifest so project folders can be moved or
+mounted elsewhere, and frame order comes from the manifest rather than from
+sorting filenames.
+"""
+
+import os
+
+import cv2
+
+from utils.file_io import save_json, load_json
+
+MANIFEST_NAME = "manifest.json"
+
+
+def image_entry(path, hold=1):
+    """Entry for a still image shown for `hold` frames."""
+    return {"type": "image", "source": path, "hold": hold}
+
+
+def video_entry(path, count, start=0, repeat=1):
+    """Entry for `count` frames of a video file starting at frame `start`, each shown `repeat` times."""
+    return {"type": "video", "source": path, "start": start, "count": count, "repeat": repeat}
+
+
+def crossfade_entry(from_path, to_path, count):
+    """Entry for `count` frames blending between two images (endpoints excluded)."""
+    return {"type": "crossfade", "source": from_path, "target": to_path, "count": count}
+
+
+def entry_frame_count(entry):
+    """Number of frames an entry contributes."""
+    if entry["type"] == "image":
+        return entry["hold"]
+    return entry["count"] * entry.get("repeat", 1)
+
+
+class FrameManifest:
+    """Ordered list of frame segments, saved as JSON next to the files it references."""
+
+    def __init__(self, path, fps=24, segments=None):
+        self.path = path
+        self.folder = os.path.dirname(os.path.abspath(path))
+        self.fps = fps
+        self.segments = segments or []
+
+    @classmethod
+    def load(cls, path):
+        """Read a manifest from disk."""
+        data = load_json(path)
+        return cls(path, fps=data.get("fps", 24), segments=data.get("segments", []))
+
+    def save(self):
+        """Write the manifest to disk."""
+        save_json({"fps": self.fps, "segments": self.segments}, self.path)
+        return self.path
+
+    @property
+    def frame_count(self):
+        """Total number of frames in the sequence."""
+        return sum(segment["count"] for segment in self.segments)
+
+    def relative(self, path):
+        """Express a path relative to the manifest's folder."""
+        return os.path.relpath(os.path.abspath(path), self.folder)
+
+    def resolve(self, path):
+        """Turn a stored path back into a usable one."""
+        return os.path.normpath(os.path.join(self.folder, path))
+
+    def add_segment(self, entries):
+        """Append a segment of entries whose paths are absolute or relative to the cwd."""
+        stored = []
+        for entry in entries:
+            entry = dict(entry)
+            entry["source"] = self.relative(entry["source"])
+            if "target" in entry:
+                entry["target"] = self.relative(entry["target"])
+            stored.append(entry)
+
+        segment = {
+            "index": len(self.segments),
+            "offset": self.frame_count,
+            "count": sum(entry_frame_count(entry) for entry in stored),
+            "entries": stored,
+        }
+        self.segments.append(segment)
+        return segment
+
+    def extend(self, other):
+        """Append every segment of another manifest, rebasing its paths onto this one."""
+        for segment in other.segments:
+            entries = []
+            for entry in segment["entries"]:
+                entry = dict(entry)
+                entry["source"] = other.resolve(entry["source"])
+                if "target" in entry:
+                    entry["target"] = other.resolve(entry["target"])
+                entries.append(entry)
+            self.add_segment(entries)
+
+    def iter_frames(self):
+        """Yield every frame, in order, as a BGR array."""
+        for segment in self.segments:
+            yield from self._iter_entries(segment["entries"])
+
+    def iter_segment_frames(self, index):
+        """Yield the frames of a single segment as BGR arrays."""
+        return self._iter_entries(self.segments[index]["entries"])
+
+    def _iter_entries(self, entries):
+        """Decode a list of entries, reading each source file only once."""
+        for entry in entries:
+            source = self.resolve(entry["source"])
+
+            if entry["type"] == "image":
+                image = _read_image(source)
+                for _ in range(entry["hold"]):
+                    yield image
+
+            elif entry["type"] == "video":
+                repeat = entry.get("repeat", 1)
+                for frame in _read_video(source, entry["start"], entry["count"]):
+                    for _ in range(repeat):
+                        yield frame
+
+            elif entry["type"] == "crossfade":
+                image1 = _read_image(source)
+                image2 = _read_image(self.resolve(entry["target"]))
+                if image2.shape != image1.shape:
+                    image2 = cv2.resize(image2, (image1.shape[1], image1.shape[0]))
+
+                count = entry["count"]
+                for step in range(1, count + 1):
+                    alpha = step / (count + 1)
+                    yield cv2.addWeighted(image1, 1.0 - alpha, image2, alpha, 0.0)
+
+            else:
+                raise ValueError(f"Unknown manifest entry type: {entry['type']}")
+
+
+def _read_image(path):
+    """Read an image, raising if it is missing or unreadable."""
+    image = cv2.imread(path)
+    if image is None:
+        raise ValueError(f"Could not read image: {path}")
+    return image
+
+
+def _read_video(path, start, count):
+    """Yield up to `count` frames of a video starting at frame `start`."""
+    cap = cv2.VideoCapture(path)
+    try:
+        if start:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+
+        for _ in range(count):
+            ret, frame = cap.read()
+            if not ret:
+                break
+            yield frame
+    finally:
+        cap.release()
+
+
+def count_video_frames(path):
+    """Count the frames of a video by reading through it once."""
+    cap = cv2.VideoCapture(path)
+    count = 0
+    try:
+        while cap.grab():
+            count += 1
+    finally:
+        cap.release()
+    return count
@@ -0,0 +1,143 @@
+"""Progressive HLS output so playback can start before the whole video is rendered."""
+
+import itertools
+import math
+import os
+import shutil
+import subprocess
+
+import cv2
+
+from utils.video import iter_source_frames
+
+
+class HLSWriter:
+    """Encodes frame batches into MPEG-TS segments and keeps a live HLS playlist up to date.
+
+    The playlist is an EVENT playlist: players can start as soon as the first
+    segment is listed and keep polling for new ones until finalize() adds the
+    end tag. Requires the ffmpeg command-line tool.
+    """
+
+    def __init__(self, project_folder, fps=24, target_duration=2,
+                 playlist_name="stream.m3u8", segment_folder="stream"):
+        """Prepare the playlist and segment folder inside the project folder."""
+        self.ffmpeg = shutil.which("ffmpeg")
+        if not self.ffmpeg:
+            raise RuntimeError(
+                "ffmpeg not found. Install it to use streaming output "
+                "(https://ffmpeg.org/download.html)."
+            )
+
+        self.fps = fps
+        self.target_duration = target_duration
+        self.playlist_path = os.path.join(project_folder, playlist_name)
+        self.segment_folder_name = segment_folder
+        self.segment_folder = os.path.join(project_folder, segment_folder)
+        os.makedirs(self.segment_folder, exist_ok=True)
+
+        self.segments = []
+        self.elapsed = 0.0
+        self.finished = False
+        self._write_playlist()
+
+    def add_segment(self, frames):
+        """Encode frames as one or more segments and publish them in the playlist.
+
+        frames may be image paths or BGR arrays, in any iterable; it is
+        consumed lazily, one playlist segment at a time.
+        """
+        if self.finished:
+            raise ValueError("Cannot add segments to a finalized stream")
+
+        # Segments may not exceed the target duration declared in the playlist
+        max_frames = int(self.target_duration * self.fps)
+        source = iter_source_frames(frames)
+        written = []
+
+        while True:
+            chunk = list(itertools.islice(source, max_frames))
+            if not chunk:
+                break
+
+            segment_name = f"segment_{len(self.segments):05d}.ts"
+            segment_path = os.path.join(self.segment_folder, segment_name)
+            self._encode_segment(chunk, segment_path)
+
+            duration = len(chunk) / self.fps
+            self.segments.append((segment_name, duration))
+            self.elapsed += duration
+            written.append(segment_path)
+
+            self._write_playlist()
+
+        return written
+
+    def _encode_segment(self, frames, segment_path):
+        """Pipe raw frames through ffmpeg into an H.264 MPEG-TS segment."""
+        height, width = frames[0].shape[:2]
+        command = [
+            self.ffmpeg, "-y", "-loglevel", "error",
+            "-f", "rawvideo", "-pix_fmt", "bgr24",
+            "-s", f"{width}x{height}", "-r", str(self.fps), "-i", "-",
+            "-vf", "scale=trunc(iw/2)*2:trunc(ih/2)*2",
+            "-c:v", "libx264", "-preset", "veryfast", "-pix_fmt", "yuv420p",
+            # Every segment starts on a keyframe and continues the previous timeline
+            "-g", str(len(frames)),
+            "-output_ts_offset", f"{self.elapsed:.6f}",
+            "-f", "mpegts", segment_path
+        ]
+
+        process = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+        try:
+            for image in frames:
+                if image.shape[:2] != (height, width):
+                    image = cv2.resize(image, (width, height))
+                process.stdin.write(image.tobytes())
+        finally:
+            process.stdin.close()
+            error = process.stderr.read()
+            process.wait()
+
+        if process.returncode != 0:
+            raise RuntimeError(f"ffmpeg failed for {segment_path}: {error.decode(errors='replace')}")
+
+    def _write_playlist(self):
+        """Rewrite the playlist atomically so players never see a partial file."""
+        target = max([self.target_duration] + [math.ceil(d) for _, d in self.segments])
+
+        lines = [
+            "#EXTM3U",
+            "#EXT-X-VERSION:3",
+            "#EXT-X-PLAYLIST-TYPE:EVENT",
+            f"#EXT-X-TARGETDURATION:{target}",
+            "#EXT-X-MEDIA-SEQUENCE:0",
+        ]
+        for name, duration in self.segments:
+            lines.append(f"#EXTINF:{duration:.3f},")
+            lines.append(f"{self.segment_folder_name}/{name}")
+        if self.finished:
+            lines.append("#EXT-X-ENDLIST")
+
+        temp_path = self.playlist_path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(temp_path, self.playlist_path)
+
+    def finalize(self, remux_path=None):
+        """Close the playlist and optionally remux all segments into a single MP4."""
+        self.finished = True
+        self._write_playlist()
+
+        if remux_path and self.segments:
+            command = [
+                self.ffmpeg, "-y", "-loglevel", "error",
+                "-i", self.playlist_path,
+                "-c", "copy", "-movflags", "+faststart", remux_path
+            ]
+            result = subprocess.run(command, capture_output=True)
+            if result.returncode != 0:
+                raise RuntimeError(f"ffmpeg remux failed: {result.stderr.decode(errors='replace')}")
+            return remux_path
+
+        return self.playlist_path
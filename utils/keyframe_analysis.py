@@ -0,0 +1,105 @@
+"""Cheap keyframe comparison used to decide how much interpolation each pair needs."""
+
+import numpy as np
+from PIL import Image
+
+THUMBNAIL_SIZE = 64
+HASH_SIZE = 8
+
+# FILM's default depth: 2**4 - 1 = 15 in-between frames
+DEFAULT_TIMES_TO_INTERPOLATE = 4
+
+HOLD = "hold"
+CROSSFADE = "crossfade"
+INTERPOLATE = "interpolate"
+
+# Pairs this close are treated as the same image and simply held
+HOLD_MAX_HASH_DISTANCE = 2
+HOLD_MAX_MOTION = 0.02
+
+# Pairs this close get a local crossfade instead of a FILM call
+CROSSFADE_MAX_HASH_DISTANCE = 8
+CROSSFADE_MAX_MOTION = 0.06
+
+# (max motion, times_to_interpolate) from calmest to busiest
+MOTION_LEVELS = [
+    (0.04, 2),
+    (0.10, 3),
+]
+
+
+def load_thumbnails(image_paths, size=THUMBNAIL_SIZE):
+    """Load images as a (count, size, size) stack of grayscale floats in [0, 1]."""
+    thumbnails = np.empty((len(image_paths), size, size), dtype=np.float32)
+
+    for i, path in enumerate(image_paths):
+        with Image.open(path) as img:
+            img.draft("L", (size, size))
+            thumb = img.convert("L").resize((size, size), Image.BILINEAR)
+        thumbnails[i] = np.asarray(thumb, dtype=np.float32) / 255.0
+
+    return thumbnails
+
+
+def perceptual_hashes(thumbnails, hash_size=HASH_SIZE):
+    """Average-hash every thumbnail into a (count, hash_size**2) boolean array."""
+    count, height, width = thumbnails.shape
+    blocks = thumbnails.reshape(
+        count, hash_size, height // hash_size, hash_size, width // hash_size
+    ).mean(axis=(2, 4))
+
+    flat = blocks.reshape(count, -1)
+    return flat > np.median(flat, axis=1, keepdims=True)
+
+
+def times_for_motion(motion):
+    """Pick FILM's times_to_interpolate for a given motion estimate."""
+    for max_motion, times in MOTION_LEVELS:
+        if motion < max_motion:
+            return times
+    return DEFAULT_TIMES_TO_INTERPOLATE
+
+
+def analyze_keyframes(image_paths):
+    """Plan the transition for each consecutive keyframe pair.
+
+    Returns one dict per pair with the hash distance, the mean absolute
+    difference of the thumbnails (0 = identical, 1 = inverted), the chosen
+    mode (hold, crossfade or interpolate) and times_to_interpolate.
+    """
+    if len(image_paths) < 2:
+        return []
+
+    thumbnails = load_thumbnails(image_paths)
+    hashes = perceptual_hashes(thumbnails)
+
+    distances = np.count_nonzero(hashes[1:] != hashes[:-1], axis=1)
+    motions = np.abs(thumbnails[1:] - thumbnails[:-1]).mean(axis=(1, 2))
+
+    plans = []
+    for distance, motion in zip(distances.tolist(), motions.tolist()):
+        if distance <= HOLD_MAX_HASH_DISTANCE and motion < HOLD_MAX_MOTION:
+            mode = HOLD
+        elif distance <= CROSSFADE_MAX_HASH_DISTANCE and motion < CROSSFADE_MAX_MOTION:
+            mode = CROSSFADE
+        else:
+            mode = INTERPOLATE
+
+        plans.append({
+            "mode": mode,
+            "hash_distance": distance,
+            "motion": round(motion, 4),
+            "times_to_interpolate": times_for_motion(motion),
+        })
+
+    return plans
+
+
+def default_plan():
+    """Plan used when keyframes could not be analyzed: a full FILM call."""
+    return {
+        "mode": INTERPOLATE,
+        "hash_distance": None,
+        "motion": None,
+        "times_to_interpolate": DEFAULT_TIMES_TO_INTERPOLATE,
+    }
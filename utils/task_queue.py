@@ -0,0 +1,460 @@
+"""Shared task queues that let several worker processes drain one render queue."""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from utils.file_io import OUTPUT_DIR
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+def _make_task(task_id, project_id, kind, payload, attempts=0):
+    """Build the task dictionary handed to workers."""
+    return {
+        "id": task_id,
+        "project_id": project_id,
+        "kind": kind,
+        "payload": payload,
+        "attempts": attempts,
+    }
+
+
+class SQLiteTaskQueue:
+    """Task queue backed by a SQLite file, for several workers on one machine."""
+
+    def __init__(self, path=None, max_attempts=3):
+        """Open (and create if needed) the queue database."""
+        self.path = path or os.path.join(OUTPUT_DIR, "queue.sqlite")
+        self.max_attempts = max_attempts
+        self._local = threading.local()
+
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute('''CREATE TABLE IF NOT EXISTS tasks (
+                id TEXT PRIMARY KEY,
+                project_id TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                worker TEXT,
+                lease_expires REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                created REAL NOT NULL
+            )''')
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, created)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cancelled_projects (project_id TEXT PRIMARY KEY)"
+            )
+
+    def _connect(self):
+        """Return this thread's connection to the database."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return _Transaction(conn)
+
+    def enqueue(self, task_id, project_id, kind, payload):
+        """Add a task; returns False if it already exists or its project was cancelled."""
+        return self.enqueue_many(project_id, kind, [(task_id, payload)]) == 1
+
+    def enqueue_many(self, project_id, kind, tasks):
+        """Add a fan-out of (task_id, payload) pairs atomically; returns how many were new.
+
+        No worker can see part of the fan-out, so count_open() only reaches
+        zero once every task of the stage has finished.
+        """
+        with self._connect() as conn:
+            if conn.execute(
+                "SELECT 1 FROM cancelled_projects WHERE project_id = ?", (project_id,)
+            ).fetchone():
+                return 0
+
+            added = 0
+            now = time.time()
+            for task_id, payload in tasks:
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO tasks (id, project_id, kind, payload, status, created) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (task_id, project_id, kind, json.dumps(payload), PENDING, now)
+                )
+                added += cursor.rowcount
+            return added
+
+    def lease(self, worker_id, lease_seconds=60):
+        """Claim the oldest runnable task, including ones whose lease has expired."""
+        now = time.time()
+
+        with self._connect() as conn:
+            # Expired tasks that are out of attempts are left for reap_expired()
+            row = conn.execute(
+                "SELECT id, project_id, kind, payload, attempts FROM tasks "
+                "WHERE status = ? OR (status = ? AND lease_expires < ? AND attempts < ?) "
+                "ORDER BY created LIMIT 1",
+                (PENDING, LEASED, now, self.max_attempts)
+            ).fetchone()
+
+            if row is None:
+                return None
+
+            task_id, project_id, kind, payload, attempts = row
+            conn.execute(
+                "UPDATE tasks SET status = ?, worker = ?, lease_expires = ?, attempts = ? "
+                "WHERE id = ?",
+                (LEASED, worker_id, now + lease_seconds, attempts + 1, task_id)
+            )
+
+        return _make_task(task_id, project_id, kind, json.loads(payload), attempts + 1)
+
+    def reap_expired(self):
+        """Fail tasks whose worker died on their last attempt, and return them.
+
+        Each task is returned to exactly one caller, which should advance the
+        pipeline past it as if the worker had failed it itself.
+        """
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, project_id, kind, payload, attempts FROM tasks "
+                "WHERE status = ? AND lease_expires < ? AND attempts >= ?",
+                (LEASED, time.time(), self.max_attempts)
+            ).fetchall()
+
+            for row in rows:
+                conn.execute(
+                    "UPDATE tasks SET status = ?, error = 'lease expired', lease_expires = NULL "
+                    "WHERE id = ?",
+                    (FAILED, row[0])
+                )
+
+        return [
+            _make_task(task_id, project_id, kind, json.loads(payload), attempts)
+            for task_id, project_id, kind, payload, attempts in rows
+        ]
+
+    def heartbeat(self, task_id, worker_id, lease_seconds=60):
+        """Extend a lease; returns False if the worker no longer holds it."""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE tasks SET lease_expires = ? WHERE id = ? AND worker = ? AND status = ?",
+                (time.time() + lease_seconds, task_id, worker_id, LEASED)
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, task_id, worker_id):
+        """Mark a leased task as done."""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE tasks SET status = ?, lease_expires = NULL "
+                "WHERE id = ? AND worker = ? AND status = ?",
+                (DONE, task_id, worker_id, LEASED)
+            )
+            return cursor.rowcount == 1
+
+    def fail(self, task_id, worker_id, error):
+        """Release a task after an error so it is retried, or failed for good."""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE tasks SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, "
+                "error = ?, lease_expires = NULL "
+                "WHERE id = ? AND worker = ? AND status = ?",
+                (self.max_attempts, FAILED, PENDING, str(error), task_id, worker_id, LEASED)
+            )
+            return cursor.rowcount == 1
+
+    def cancel_project(self, project_id):
+        """Drop a project's pending tasks and revoke running ones' leases."""
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO cancelled_projects (project_id) VALUES (?)", (project_id,)
+            )
+            cursor = conn.execute(
+                "UPDATE tasks SET status = ?, lease_expires = NULL "
+                "WHERE project_id = ? AND status IN (?, ?)",
+                (CANCELLED, project_id, PENDING, LEASED)
+            )
+            return cursor.rowcount
+
+    def count_open(self, project_id, kind):
+        """Count tasks of a kind that are still pending or running for a project."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT COUNT(*) FROM tasks WHERE project_id = ? AND kind = ? AND status IN (?, ?)",
+                (project_id, kind, PENDING, LEASED)
+            ).fetchone()
+            return row[0]
+
+
+class _Transaction:
+    """Run a block of statements inside one immediate SQLite transaction."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.conn.execute("COMMIT")
+        else:
+            self.conn.execute("ROLLBACK")
+
+
+# Adds a project's fan-out in one step; ARGV = prefix, project, kind, pending, then id/payload pairs
+_REDIS_ENQUEUE = """
+local prefix, project, kind, pending = ARGV[1], ARGV[2], ARGV[3], ARGV[4]
+if redis.call('SISMEMBER', prefix .. ':cancelled', project) == 1 then
+    return 0
+end
+
+local added = 0
+for i = 5, #ARGV, 2 do
+    local task_id = ARGV[i]
+    local task_key = prefix .. ':task:' .. task_id
+    if redis.call('HSETNX', task_key, 'id', task_id) == 1 then
+        redis.call('HSET', task_key, 'project_id', project, 'kind', kind,
+                   'payload', ARGV[i + 1], 'status', pending, 'attempts', 0)
+        redis.call('INCR', prefix .. ':open:' .. project .. ':' .. kind)
+        redis.call('SADD', prefix .. ':project:' .. project, task_id)
+        redis.call('RPUSH', prefix .. ':pending', task_id)
+        added = added + 1
+    end
+end
+return added
+"""
+
+# Pops the oldest pending task and leases it in one step, so a worker dying
+# mid-lease cannot leave a task in neither the pending list nor the leased set.
+# ARGV = prefix, pending, leased, worker, lease expiry; returns the task's fields
+_REDIS_LEASE = """
+local prefix, pending, leased, worker, expires = ARGV[1], ARGV[2], ARGV[3], ARGV[4], ARGV[5]
+while true do
+    local task_id = redis.call('LPOP', prefix .. ':pending')
+    if not task_id then
+        return false
+    end
+
+    -- Tasks of cancelled projects stay on the list until popped; skip them
+    local task_key = prefix .. ':task:' .. task_id
+    if redis.call('HGET', task_key, 'status') == pending then
+        local attempts = redis.call('HINCRBY', task_key, 'attempts', 1)
+        redis.call('HSET', task_key, 'status', leased, 'worker', worker)
+        redis.call('ZADD', prefix .. ':leased', expires, task_id)
+        local fields = redis.call('HMGET', task_key, 'project_id', 'kind', 'payload')
+        return {task_id, fields[1], fields[2], fields[3], attempts}
+    end
+end
+"""
+
+# Takes a task off the leased set and retries or fails it, in one step.
+# ARGV = prefix, task id, error, max attempts, expired ("1" if no worker is left
+# to advance the pipeline), then the pending and failed statuses
+_REDIS_RELEASE = """
+local prefix, task_id, error, max_attempts, expired = ARGV[1], ARGV[2], ARGV[3], tonumber(ARGV[4]), ARGV[5]
+local pending, failed = ARGV[6], ARGV[7]
+if redis.call('ZREM', prefix .. ':leased', task_id) == 0 then
+    return 0
+end
+
+local task_key = prefix .. ':task:' .. task_id
+local fields = redis.call('HMGET', task_key, 'attempts', 'project_id', 'kind')
+if tonumber(fields[1] or 0) >= max_attempts then
+    redis.call('HSET', task_key, 'status', failed, 'error', error)
+    redis.call('DECR', prefix .. ':open:' .. fields[2] .. ':' .. fields[3])
+    if expired == '1' then
+        redis.call('RPUSH', prefix .. ':expired', task_id)
+    end
+else
+    redis.call('HSET', task_key, 'status', pending, 'error', error)
+    redis.call('RPUSH', prefix .. ':pending', task_id)
+end
+return 1
+"""
+
+# Takes a task off the leased set and marks it done, in one step.
+# ARGV = prefix, task id, done status
+_REDIS_COMPLETE = """
+local prefix, task_id, done = ARGV[1], ARGV[2], ARGV[3]
+if redis.call('ZREM', prefix .. ':leased', task_id) == 0 then
+    return 0
+end
+
+local task_key = prefix .. ':task:' .. task_id
+local fields = redis.call('HMGET', task_key, 'project_id', 'kind')
+redis.call('HSET', task_key, 'status', done)
+redis.call('DECR', prefix .. ':open:' .. fields[1] .. ':' .. fields[2])
+return 1
+"""
+
+
+class RedisTaskQueue:
+    """Task queue backed by Redis (or any Redis-compatible server) for clusters."""
+
+    def __init__(self, url="redis://localhost:6379/0", prefix="vidgen", max_attempts=3):
+        """Connect to the Redis server at the given URL."""
+        try:
+            import redis
+        except ImportError:
+            raise ImportError(
+                "The redis package is required for Redis queues. "
+                "Install it with: pip install redis"
+            )
+
+        self.redis = redis.Redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+        self.max_attempts = max_attempts
+        self._enqueue_script = self.redis.register_script(_REDIS_ENQUEUE)
+        self._lease_script = self.redis.register_script(_REDIS_LEASE)
+        self._release_script = self.redis.register_script(_REDIS_RELEASE)
+        self._complete_script = self.redis.register_script(_REDIS_COMPLETE)
+
+    def _key(self, *parts):
+        """Build a namespaced Redis key."""
+        return ":".join((self.prefix,) + parts)
+
+    def enqueue(self, task_id, project_id, kind, payload):
+        """Add a task; returns False if it already exists or its project was cancelled."""
+        return self.enqueue_many(project_id, kind, [(task_id, payload)]) == 1
+
+    def enqueue_many(self, project_id, kind, tasks):
+        """Add a fan-out of (task_id, payload) pairs atomically; returns how many were new.
+
+        No worker can see part of the fan-out, so count_open() only reaches
+        zero once every task of the stage has finished.
+        """
+        args = [self.prefix, project_id, kind, PENDING]
+        for task_id, payload in tasks:
+            args.extend([task_id, json.dumps(payload)])
+        return self._enqueue_script(args=args)
+
+    def lease(self, worker_id, lease_seconds=60):
+        """Claim the oldest runnable task, including ones whose lease has expired."""
+        self._requeue_expired()
+
+        leased = self._lease_script(args=[
+            self.prefix, PENDING, LEASED, worker_id, repr(time.time() + lease_seconds)
+        ])
+        if not leased:
+            return None
+
+        task_id, project_id, kind, payload, attempts = leased
+        return _make_task(task_id, project_id, kind, json.loads(payload), int(attempts))
+
+    def _requeue_expired(self):
+        """Put tasks whose workers stopped heartbeating back on the pending list."""
+        leased_key = self._key("leased")
+        for task_id in self.redis.zrangebyscore(leased_key, 0, time.time()):
+            # Only the worker whose script removes it from the leased set requeues the task
+            self._release(task_id, "lease expired", expired=True)
+
+    def _release(self, task_id, error, expired=False):
+        """Return a leased task to the pending list, or fail it once out of attempts.
+
+        Returns False if the task was no longer leased. Expired tasks that fail
+        are queued for reap_expired(), since no worker is left to advance past them.
+        """
+        return bool(self._release_script(args=[
+            self.prefix, task_id, str(error), self.max_attempts,
+            "1" if expired else "0", PENDING, FAILED
+        ]))
+
+    def reap_expired(self):
+        """Fail tasks whose worker died on their last attempt, and return them.
+
+        Each task is returned to exactly one caller, which should advance the
+        pipeline past it as if the worker had failed it itself.
+        """
+        self._requeue_expired()
+
+        tasks = []
+        while True:
+            task_id = self.redis.lpop(self._key("expired"))
+            if task_id is None:
+                return tasks
+
+            fields = self.redis.hgetall(self._key("task", task_id))
+            tasks.append(_make_task(
+                task_id, fields["project_id"], fields["kind"],
+                json.loads(fields["payload"]), int(fields["attempts"])
+            ))
+
+    def _holds_lease(self, task_id, worker_id):
+        """Check that a worker still owns a task's lease."""
+        status, worker = self.redis.hmget(self._key("task", task_id), "status", "worker")
+        return status == LEASED and worker == worker_id
+
+    def heartbeat(self, task_id, worker_id, lease_seconds=60):
+        """Extend a lease; returns False if the worker no longer holds it."""
+        if not self._holds_lease(task_id, worker_id):
+            return False
+        updated = self.redis.zadd(
+            self._key("leased"), {task_id: time.time() + lease_seconds}, xx=True, ch=True
+        )
+        return bool(updated)
+
+    def complete(self, task_id, worker_id):
+        """Mark a leased task as done."""
+        if not self._holds_lease(task_id, worker_id):
+            return False
+        return bool(self._complete_script(args=[self.prefix, task_id, DONE]))
+
+    def fail(self, task_id, worker_id, error):
+        """Release a task after an error so it is retried, or failed for good."""
+        if not self._holds_lease(task_id, worker_id):
+            return False
+        return self._release(task_id, error)
+
+    def cancel_project(self, project_id):
+        """Drop a project's pending tasks and revoke running ones' leases."""
+        self.redis.sadd(self._key("cancelled"), project_id)
+
+        cancelled = 0
+        for task_id in self.redis.smembers(self._key("project", project_id)):
+            task_key = self._key("task", task_id)
+            status, kind = self.redis.hmget(task_key, "status", "kind")
+            if status not in (PENDING, LEASED):
+                continue
+
+            pipe = self.redis.pipeline()
+            pipe.hset(task_key, "status", CANCELLED)
+            pipe.zrem(self._key("leased"), task_id)
+            pipe.decr(self._key("open", project_id, kind))
+            pipe.execute()
+            cancelled += 1
+
+        return cancelled
+
+    def count_open(self, project_id, kind):
+        """Count tasks of a kind that are still pending or running for a project."""
+        return int(self.redis.get(self._key("open", project_id, kind)) or 0)
+
+
+def open_queue(url=None):
+    """Open a task queue from a URL such as sqlite:///path or redis://host:6379/0."""
+    url = url or os.getenv("VIDGEN_QUEUE_URL", "")
+
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisTaskQueue(url)
+
+    if url.startswith("sqlite:///"):
+        return SQLiteTaskQueue(url[len("sqlite:///"):])
+
+    if url:
+        raise ValueError(f"Unsupported queue URL: {url}")
+
+    return SQLiteTaskQueue()
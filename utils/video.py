@@ -4,6 +4,8 @@ import os
 import cv2
 import glob
 
+from utils.frame_manifest import FrameManifest, MANIFEST_NAME
+
 
 def images_to_video(image_paths, output_path, fps=24, duration_per_image=1.0):
     """Create a video from a list of images, showing each for specified duration."""
@@ -42,7 +44,23 @@ def images_to_video(image_paths, output_path, fps=24, duration_per_image=1.0):
 
 
 def frames_to_video(frames_folder, output_path, fps=24):
-    """Create a video from a folder of sequential frames."""
+    """Create a video from a frame manifest, or from a folder of sequential frames.
+
+    If the folder (or the path itself) is a manifest written by the
+    interpolation agent, frames are read straight from the files it references.
+    """
+    manifest_path = frames_folder
+    if os.path.isdir(frames_folder):
+        manifest_path = os.path.join(frames_folder, MANIFEST_NAME)
+
+    if os.path.isfile(manifest_path):
+        manifest = FrameManifest.load(manifest_path)
+        if manifest.frame_count == 0:
+            raise ValueError(f"No frames listed in {manifest_path}")
+
+        print(f"  Found {manifest.frame_count} frames in manifest")
+        return _write_video(manifest.iter_frames(), output_path, fps)
+
     pattern = os.path.join(frames_folder, "*.png")
     frame_paths = sorted(glob.glob(pattern))
 
@@ -57,3 +75,257 @@ def frames_to_video(frames_folder, output_path, fps=24):
         fps=fps,
         duration_per_image=1.0/fps
     )
+
+
+def _write_video(frames, output_path, fps):
+    """Write an iterable of BGR frames to an MP4, sized by the first frame."""
+    output_folder = os.path.dirname(output_path)
+    if output_folder:
+        os.makedirs(output_folder, exist_ok=True)
+
+    video_writer = None
+    for image in frames:
+        if video_writer is None:
+            height, width = image.shape[:2]
+            fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+            video_writer = cv2.VideoWriter(output_path, fourcc, fps, (width, height))
+        elif image.shape[:2] != (height, width):
+            image = cv2.resize(image, (width, height))
+        video_writer.write(image)
+
+    if video_writer is None:
+        raise ValueError("No frames provided!")
+
+    video_writer.release()
+    return output_path
+
+
+def iter_source_frames(source):
+    """Yield BGR frames from a FrameManifest, or from a list of image paths or arrays."""
+    if hasattr(source, "iter_frames"):
+        yield from source.iter_frames()
+        return
+
+    for item in source:
+        if isinstance(item, str):
+            image = cv2.imread(item)
+            if image is None:
+                print(f"  WARNING: Could not read {item}, skipping")
+                continue
+            yield image
+        else:
+            yield item
+
+
+# Renditions written by encode_renditions. Each is a dict with:
+#   name, filename, format ("mp4", "gif", "webp" or "poster")
+#   width / height  - target size; give one to keep the aspect ratio (default: source size)
+#   fps             - output frame rate, lower than the source to drop frames (default: source fps)
+#   codec           - fourcc for mp4 renditions (default "mp4v")
+#   quality         - 0-100 encoder quality, where the backend supports it
+#   max_frames      - cap on frames kept in memory for gif/webp renditions
+#   position        - where to grab the poster frame, 0.0 (start) to 1.0 (end)
+#   required        - if True, a failure fails the whole encode; others are only warned about
+DEFAULT_RENDITIONS = [
+    {"name": "full", "filename": "final.mp4", "format": "mp4", "required": True},
+    {"name": "720p", "filename": "final_720p.mp4", "format": "mp4", "height": 720},
+    {"name": "thumbnail", "filename": "thumbnail.webp", "format": "webp",
+     "height": 180, "fps": 8, "max_frames": 96},
+    {"name": "poster", "filename": "poster.jpg", "format": "poster", "position": 0.5},
+]
+
+
+def encode_renditions(frames, output_folder, renditions=None, fps=24):
+    """Encode several renditions of a frame sequence while decoding each frame once.
+
+    frames is a FrameManifest or a list of image paths. Frames are decoded on
+    the calling thread and handed to one encoder thread per rendition through
+    small bounded queues, so memory stays flat however long the video is.
+    Returns a dict mapping rendition name to output path; optional renditions
+    that fail are left out of it.
+    """
+    import queue
+    import threading
+
+    total_frames = frames.frame_count if hasattr(frames, "frame_count") else len(frames)
+    if not total_frames:
+        raise ValueError("No images provided!")
+
+    renditions = renditions or DEFAULT_RENDITIONS
+    os.makedirs(output_folder, exist_ok=True)
+
+    source = iter_source_frames(frames)
+    first_image = next(source, None)
+    if first_image is None:
+        raise ValueError("Could not read any frames")
+
+    source_size = (first_image.shape[1], first_image.shape[0])
+    encoders = [
+        _RenditionEncoder(rendition, output_folder, source_size, fps, total_frames)
+        for rendition in renditions
+    ]
+
+    queues = [queue.Queue(maxsize=8) for _ in encoders]
+    threads = [
+        threading.Thread(target=encoder.consume, args=(frame_queue,), daemon=True)
+        for encoder, frame_queue in zip(encoders, queues)
+    ]
+    for thread in threads:
+        thread.start()
+
+    print(f"  Encoding {total_frames} frames into {len(encoders)} renditions")
+
+    try:
+        image = first_image
+        i = 0
+        while image is not None:
+            if (image.shape[1], image.shape[0]) != source_size:
+                image = cv2.resize(image, source_size)
+
+            for frame_queue in queues:
+                frame_queue.put((i, image))
+
+            image = next(source, None)
+            i += 1
+    finally:
+        for frame_queue in queues:
+            frame_queue.put(None)
+        for thread in threads:
+            thread.join()
+
+    outputs = {}
+    for encoder in encoders:
+        if encoder.error is None:
+            outputs[encoder.name] = encoder.output_path
+            continue
+
+        if encoder.rendition.get("required"):
+            raise RuntimeError(f"Rendition '{encoder.name}' failed: {encoder.error}")
+
+        print(f"  WARNING: rendition '{encoder.name}' failed, skipping it: {encoder.error}")
+        if os.path.exists(encoder.output_path):
+            os.remove(encoder.output_path)
+
+    return outputs
+
+
+class _RenditionEncoder:
+    """Resizes, decimates and writes frames for one rendition on its own thread."""
+
+    def __init__(self, rendition, output_folder, source_size, source_fps, total_frames):
+        self.name = rendition["name"]
+        self.format = rendition.get("format", "mp4")
+        self.output_path = os.path.join(output_folder, rendition["filename"])
+        self.size = _target_size(source_size, rendition.get("width"), rendition.get("height"))
+        self.fps = min(rendition.get("fps", source_fps), source_fps)
+        self.step = source_fps / self.fps
+        self.rendition = rendition
+        self.error = None
+
+        self.poster_index = round(rendition.get("position", 0.5) * (total_frames - 1))
+        self.max_frames = rendition.get("max_frames", 240)
+        self._writer = None
+        self._images = []
+        self._next_frame = 0.0
+
+    def consume(self, frames):
+        """Encode frames from a queue until the None sentinel arrives."""
+        while True:
+            item = frames.get()
+            if item is None:
+                break
+
+            # Keep draining after an error so the decoder never blocks on us
+            if self.error is not None:
+                continue
+
+            try:
+                self._add(*item)
+            except Exception as e:
+                self.error = e
+
+        if self.error is None:
+            try:
+                self._finish()
+            except Exception as e:
+                self.error = e
+        elif self._writer is not None:
+            self._writer.release()
+
+    def _add(self, index, image):
+        """Handle one decoded source frame."""
+        if self.format == "poster":
+            if index >= self.poster_index and not self._images:
+                self._images.append(self._resize(image))
+            return
+
+        # Frame-rate decimation: keep the first frame at or after each output tick
+        if index < self._next_frame:
+            return
+        self._next_frame += self.step
+
+        image = self._resize(image)
+
+        if self.format == "mp4":
+            if self._writer is None:
+                self._writer = self._open_writer()
+            self._writer.write(image)
+        elif len(self._images) < self.max_frames:
+            self._images.append(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+
+    def _resize(self, image):
+        """Scale a frame to this rendition's size."""
+        if (image.shape[1], image.shape[0]) == self.size:
+            return image
+        return cv2.resize(image, self.size, interpolation=cv2.INTER_AREA)
+
+    def _open_writer(self):
+        """Open the OpenCV writer for an mp4 rendition."""
+        fourcc = cv2.VideoWriter_fourcc(*self.rendition.get("codec", "mp4v"))
+        writer = cv2.VideoWriter(self.output_path, fourcc, self.fps, self.size)
+        if not writer.isOpened():
+            raise ValueError(f"Could not open video writer for {self.output_path}")
+
+        if "quality" in self.rendition:
+            writer.set(cv2.VIDEOWRITER_PROP_QUALITY, self.rendition["quality"])
+        return writer
+
+    def _finish(self):
+        """Flush whatever this rendition buffered to disk."""
+        if self.format == "mp4":
+            if self._writer is not None:
+                self._writer.release()
+
+        elif self.format == "poster":
+            if self._images:
+                params = [cv2.IMWRITE_JPEG_QUALITY, self.rendition.get("quality", 90)]
+                cv2.imwrite(self.output_path, self._images[0], params)
+
+        elif self._images:
+            from PIL import Image
+
+            images = [Image.fromarray(frame) for frame in self._images]
+            images[0].save(
+                self.output_path,
+                save_all=True,
+                append_images=images[1:],
+                duration=int(1000 / self.fps),
+                loop=0,
+                quality=self.rendition.get("quality", 80)
+            )
+
+
+def _target_size(source_size, width=None, height=None):
+    """Work out an even-sized output resolution, keeping the aspect ratio when one side is given."""
+    source_width, source_height = source_size
+
+    if width and not height:
+        height = source_height * width / source_width
+    elif height and not width:
+        width = source_width * height / source_height
+    if not width or width > source_width:
+        # Never upscale
+        width, height = source_width, source_height
+
+    # Most codecs need even dimensions
+    return (max(2, int(round(width / 2)) * 2), max(2, int(round(height / 2)) * 2))
@@ -0,0 +1,302 @@
+"""Distributed worker that drains a shared render queue.
+
+Run one coordinator to submit jobs and any number of workers, on any number of
+machines, pointing at the same queue and the same output storage:
+
+    python main.py --queue redis://host:6379/0 "A cat playing with yarn"
+    python worker.py --queue redis://host:6379/0
+    python worker.py --queue redis://host:6379/0 --cancel PROJECT_ID
+"""
+
+import os
+import sys
+import glob
+import socket
+import threading
+import time
+import uuid
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from agents.director import DirectorAgent
+from agents.scene import SceneAgent
+from agents.keyframe import KeyframeAgent
+from agents.interpolation import InterpolationAgent
+from utils.file_io import (
+    save_json, load_json, create_project_folder, get_project_path, create_project_id
+)
+from utils.task_queue import open_queue
+from utils.cancellation import CancelToken, JobCancelled
+from utils.video import encode_renditions
+from utils.frame_manifest import FrameManifest, MANIFEST_NAME, image_entry
+
+PLAN = "plan"
+KEYFRAME = "keyframe"
+INTERPOLATE = "interpolate"
+ENCODE = "encode"
+
+
+def submit_job(user_prompt, queue, long_form=False):
+    """Create a project and queue its planning stage, returning the project id."""
+    project_id = create_project_id(user_prompt)
+    create_project_folder(project_id)
+
+    queue.enqueue(
+        f"{project_id}:{PLAN}", project_id, PLAN,
+        {"prompt": user_prompt, "long_form": long_form}
+    )
+    return project_id
+
+
+def segment_folder(project_id, index):
+    """Folder holding the clip and manifest of one interpolated keyframe pair."""
+    return get_project_path(project_id, os.path.join("4_interpolated", f"segment_{index:04d}"))
+
+
+class Worker:
+    """Leases pipeline stages from a queue and runs them with the usual agents."""
+
+    def __init__(self, queue, worker_id=None, lease_seconds=60):
+        """Set up the agents this worker needs to run any stage."""
+        self.queue = queue
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.lease_seconds = lease_seconds
+
+        self.director = DirectorAgent()
+        self.scene = SceneAgent()
+        self.keyframe = KeyframeAgent()
+        self.interpolation = InterpolationAgent()
+
+        self.agents = [self.director, self.scene, self.keyframe, self.interpolation]
+
+        self.handlers = {
+            PLAN: self._run_plan,
+            KEYFRAME: self._run_keyframe,
+            INTERPOLATE: self._run_interpolate,
+            ENCODE: self._run_encode,
+        }
+
+    def log(self, message):
+        """Print a message prefixed with the worker id."""
+        print(f"[Worker {self.worker_id}] {message}")
+
+    def run(self, poll_interval=2.0, stop_when_idle=False):
+        """Process tasks until interrupted (or until the queue is empty)."""
+        self.log("Waiting for tasks")
+
+        while True:
+            # A worker died on a task's last attempt: move its stage along in its place
+            for task in self.queue.reap_expired():
+                self.log(f"Gave up on {task['id']} after its lease expired")
+                self._advance(task)
+
+            task = self.queue.lease(self.worker_id, self.lease_seconds)
+
+            if task is None:
+                if stop_when_idle:
+                    return
+                time.sleep(poll_interval)
+                continue
+
+            self.run_task(task)
+
+    def run_task(self, task):
+        """Run one leased task while keeping its lease alive.
+
+        If the lease is lost, e.g. because the project was cancelled, the
+        task's token is cancelled and the task is abandoned mid-way.
+        """
+        self.log(f"{task['kind']} {task['id']} (attempt {task['attempts']})")
+
+        token = CancelToken()
+        for agent in self.agents:
+            agent.set_token(token)
+
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(task, stop, token), daemon=True)
+        heartbeat.start()
+
+        try:
+            self.handlers[task['kind']](task['project_id'], task['payload'])
+        except JobCancelled as e:
+            # The queue no longer counts this task as ours; leave it untouched
+            self.log(f"Abandoned {task['id']}: {e}")
+            return False
+        except Exception as e:
+            self.log(f"ERROR: {e}")
+            self.queue.fail(task['id'], self.worker_id, e)
+            if task['attempts'] >= self.queue.max_attempts:
+                # Carry on without this task, as the local pipeline does
+                self._advance(task)
+            return False
+        finally:
+            stop.set()
+            heartbeat.join()
+
+        self.queue.complete(task['id'], self.worker_id)
+        self._advance(task)
+        return True
+
+    def _heartbeat(self, task, stop, token):
+        """Extend the task's lease until the handler finishes, cancelling it if the lease is lost."""
+        while not stop.wait(self.lease_seconds / 3):
+            if not self.queue.heartbeat(task['id'], self.worker_id, self.lease_seconds):
+                self.log(f"Lost lease on {task['id']}")
+                token.cancel("lease lost")
+                return
+
+    def _advance(self, task):
+        """Queue the next stage once the last task of a fan-out stage finishes."""
+        project_id = task['project_id']
+
+        if task['kind'] == KEYFRAME and self.queue.count_open(project_id, KEYFRAME) == 0:
+            self._queue_interpolation(project_id)
+
+        elif task['kind'] == INTERPOLATE and self.queue.count_open(project_id, INTERPOLATE) == 0:
+            # Task ids are deterministic, so workers racing here enqueue only once
+            self.queue.enqueue(
+                f"{project_id}:{ENCODE}", project_id, ENCODE,
+                {"keyframes": self._generated_keyframes(project_id)}
+            )
+
+    def _run_plan(self, project_id, payload):
+        """Plan shots and prompts, then fan out one task per keyframe."""
+        shot_plan = self.director.run(payload['prompt'], long_form=payload.get('long_form', False))
+        save_json(shot_plan, get_project_path(project_id, "1_director.json"))
+
+        scene_data = self.scene.run(shot_plan)
+        save_json(scene_data, get_project_path(project_id, "2_scene.json"))
+
+        # One atomic fan-out, so the stage cannot look finished while it is half queued
+        self.queue.enqueue_many(project_id, KEYFRAME, [
+            (f"{project_id}:{KEYFRAME}:{index:04d}", {"index": index})
+            for index in range(len(scene_data['keyframes']))
+        ])
+
+    def _run_keyframe(self, project_id, payload):
+        """Generate one keyframe image into the project's keyframe folder."""
+        scene_data = load_json(get_project_path(project_id, "2_scene.json"))
+        keyframe = scene_data['keyframes'][payload['index']]
+
+        keyframes_folder = get_project_path(project_id, "3_keyframes")
+        os.makedirs(keyframes_folder, exist_ok=True)
+        self.keyframe.generate_keyframe(keyframe, keyframes_folder)
+
+    def _generated_keyframes(self, project_id):
+        """Filenames of the keyframes that were generated, in shot order."""
+        scene_data = load_json(get_project_path(project_id, "2_scene.json"))
+
+        filenames = []
+        for keyframe in scene_data['keyframes']:
+            filename = f"{keyframe['keyframe_id']}.png"
+            if os.path.exists(get_project_path(project_id, os.path.join("3_keyframes", filename))):
+                filenames.append(filename)
+        return filenames
+
+    def _queue_interpolation(self, project_id):
+        """Fan out one task per consecutive pair of the keyframes that were generated."""
+        filenames = self._generated_keyframes(project_id)
+
+        if len(filenames) < 2:
+            self.queue.enqueue(f"{project_id}:{ENCODE}", project_id, ENCODE, {"keyframes": filenames})
+            return
+
+        self.queue.enqueue_many(project_id, INTERPOLATE, [
+            (f"{project_id}:{INTERPOLATE}:{index:04d}",
+             {"index": index, "frame1": filenames[index], "frame2": filenames[index + 1]})
+            for index in range(len(filenames) - 1)
+        ])
+
+    def _run_interpolate(self, project_id, payload):
+        """Interpolate one keyframe pair into its own segment folder and manifest."""
+        keyframes_folder = get_project_path(project_id, "3_keyframes")
+        output_folder = segment_folder(project_id, payload['index'])
+
+        # Drop partial downloads from an earlier attempt; a finished clip is reused
+        for path in glob.glob(os.path.join(output_folder, "*.part")):
+            os.remove(path)
+
+        self.interpolation.run_segment(
+            os.path.join(keyframes_folder, payload['frame1']),
+            os.path.join(keyframes_folder, payload['frame2']),
+            output_folder,
+            include_first=(payload['index'] == 0)
+        )
+
+    def _run_encode(self, project_id, payload):
+        """Join every pair's segment manifest, in order, and encode the final video and its renditions.
+
+        A pair whose interpolation failed for good becomes a hard cut, as in
+        the local pipeline, so its keyframes still appear in the video.
+        """
+        interpolated_folder = get_project_path(project_id, "4_interpolated")
+        keyframes_folder = get_project_path(project_id, "3_keyframes")
+        manifest = FrameManifest(os.path.join(interpolated_folder, MANIFEST_NAME), fps=24)
+        keyframes = [os.path.join(keyframes_folder, name) for name in payload['keyframes']]
+
+        if len(keyframes) < 2:
+            manifest.add_segment([image_entry(path) for path in keyframes])
+
+        missing = []
+        for index in range(len(keyframes) - 1):
+            segment_manifest = os.path.join(segment_folder(project_id, index), MANIFEST_NAME)
+            if os.path.exists(segment_manifest):
+                manifest.extend(FrameManifest.load(segment_manifest))
+                continue
+
+            missing.append(index)
+            entries = [image_entry(keyframes[index])] if index == 0 else []
+            manifest.add_segment(entries + [image_entry(keyframes[index + 1])])
+
+        if missing:
+            self.log(f"WARNING: no interpolation for pairs {missing}, using hard cuts")
+
+        if manifest.frame_count == 0:
+            raise ValueError(f"No frames to encode for {project_id}")
+
+        manifest.save()
+        renditions = encode_renditions(
+            manifest, get_project_path(project_id, ""), fps=24
+        )
+        self.log(f"Video ready: {renditions['full']}")
+
+
+def main():
+    """Worker entry point."""
+    args = sys.argv[1:]
+    queue_url = None
+    stop_when_idle = False
+    cancel_id = None
+
+    while args:
+        arg = args.pop(0)
+        if arg == "--queue" and args:
+            queue_url = args.pop(0)
+        elif arg == "--once":
+            stop_when_idle = True
+        elif arg == "--cancel" and args:
+            cancel_id = args.pop(0)
+        else:
+            print(f"Unknown argument: {arg}")
+            print("Usage: python worker.py [--queue URL] [--once] [--cancel PROJECT_ID]")
+            return 1
+
+    if cancel_id:
+        cancelled = open_queue(queue_url).cancel_project(cancel_id)
+        print(f"Cancelled {cancel_id}: {cancelled} task(s) dropped or revoked")
+        return 0
+
+    worker = Worker(open_queue(queue_url))
+
+    try:
+        worker.run(stop_when_idle=stop_when_idle)
+    except KeyboardInterrupt:
+        print("\n\nWorker stopped.")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())